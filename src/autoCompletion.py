@@ -2,9 +2,9 @@ from prompt_toolkit.completion import Completer, Completion
 import glob
 
 COMMANDS = ["cd", "pwd", "ls", "cat", "echo", "head", "tail", "grep", "find",
-            "sort", "uniq", "cut", "--help", "_cd", "_pwd", "_ls", "_cat",
+            "sort", "uniq", "cut", "wait", "jobs", "filecache", "memocache", "--help", "_cd", "_pwd", "_ls", "_cat",
             "_echo", "_head", "_tail", "_grep",
-            "_find", "_sort", "_uniq", "_cut"]
+            "_find", "_sort", "_uniq", "_cut", "_wait", "_jobs", "_filecache", "_memocache"]
 
 
 # A customized autocomplete class
@@ -1,18 +1,28 @@
 import sys
 import os
-from collections import deque
 from prompt_toolkit import PromptSession
 from prompt_toolkit.lexers import PygmentsLexer
 
-from shellParsing import CommandParser
+from shellParsing import CommandParser, ScriptParser, PARSE_CACHE
+from shellOutput import OutputSink
+from shellJobs import JOBS
+from shellWorkerPool import WORKER_POOL
+import shellProfile
 from syntaxHighlighting import Comp0010ShellLexer
 from autoCompletion import ShellCompleter, COMMANDS
 
 
+SCRIPT_ERROR_MODES = ("--stop-on-error", "--continue-on-error")
+
+
 class Comp0010Shell:
     def __init__(self):
-        self.out = deque()
+        self.out = OutputSink(self.write)
         self.commands = COMMANDS
+        self.session = None
+
+    # The prompt session is only needed, and only works on a terminal, in interactive mode
+    def create_session(self):
         self.session = PromptSession(
             lexer=PygmentsLexer(Comp0010ShellLexer),
             completer=ShellCompleter(self.commands)
@@ -23,24 +33,113 @@ class Comp0010Shell:
         parser = CommandParser(cmdline, self.out)
         parser.parse()
 
-    # Get results after applications and print them out
+    # Results are printed while the applications run, the rest once the line is done
     def run_command_line(self, cmdline):
-        self.eval(cmdline)
-        while len(self.out) > 0:
-            print(self.out.popleft(), end="")
+        try:
+            self.eval(cmdline)
+        finally:
+            self.print_output()
 
-    # Support interactive and non-interactive shell execution
+    def print_output(self):
+        self.out.flush()
+
+    # Background jobs nobody waited for still print their output, in job order
+    def finish_jobs(self):
+        try:
+            JOBS.wait(self.out)
+        finally:
+            self.print_output()
+
+    def exit_jobs(self):
+        try:
+            self.finish_jobs()
+        except Exception as e:
+            print(f"Error: {e}", file=sys.stderr)
+
+    # The sink decides when to write, stdout is only flushed as well for line by line
+    # output or when someone is watching the terminal
+    def write(self, text):
+        print(text, end="")
+        if self.out.flush_policy == "line" or sys.stdout.isatty():
+            sys.stdout.flush()
+
+    # Parse the whole script first and only run it if every line is valid
+    def run_script(self, lines, keep_going=False):
+        plans, errors = ScriptParser(lines).parse()
+        for lineno, error in errors:
+            print(f"Syntax error on line {lineno}: {error}", file=sys.stderr)
+        if errors:
+            return 2
+
+        status = 0
+        for lineno, cmdline, plan in plans:
+            try:
+                CommandParser(cmdline, self.out).parse(plan)
+            except Exception as e:
+                status = 1
+                self.print_output()
+                print(f"Error on line {lineno}: {str(e).rstrip()}", file=sys.stderr)
+                if not keep_going:
+                    break
+            self.print_output()
+        try:
+            self.finish_jobs()
+        except Exception as e:
+            status = 1
+            print(f"Error: {e}", file=sys.stderr)
+        return status
+
+    # Handle 'sh -f SCRIPT [MODE]', where SCRIPT '-' reads the script from stdin
+    def run_script_file(self, args):
+        if len(args) not in (1, 2):
+            raise ValueError("Wrong number of program arguments")
+        if len(args) == 2 and args[1] not in SCRIPT_ERROR_MODES:
+            raise ValueError(f"Unexpected program argument {args[1]}")
+        keep_going = args[1:] == ["--continue-on-error"]
+
+        if args[0] == "-":
+            return self.run_script(sys.stdin.readlines(), keep_going)
+        with open(args[0]) as f:
+            lines = f.readlines()
+        return self.run_script(lines, keep_going)
+
+    # Job threads and worker processes started by the session are stopped when the
+    # shell exits, jobs first as they may use the workers. A profiled session ends
+    # with the counters of the parse cache
     def run_shell(self):
-        # Command line argument processing
-        argsNum = len(sys.argv) - 1
+        try:
+            return self.run_session()
+        finally:
+            JOBS.shutdown()
+            WORKER_POOL.shutdown()
+            if shellProfile.PROFILER is not None:
+                shellProfile.PROFILER.report_cache("parse", PARSE_CACHE.info())
+
+    # Support interactive and non-interactive shell execution
+    def run_session(self):
+        # Command line argument processing, '--profile[=FILE]' may come first
+        args = sys.argv[1:]
+        if args and args[0].partition("=")[0] == "--profile":
+            shellProfile.enable(args.pop(0).partition("=")[2] or None)
+        argsNum = len(args)
         if argsNum > 0:
+            if args[0] == "-f":
+                return self.run_script_file(args[1:])
             if argsNum != 2:
                 raise ValueError("Wrong number of program arguments")
-            if sys.argv[1] != "-c":
-                raise ValueError(f"Unexpected program argument {sys.argv[1]}")
-            self.run_command_line(sys.argv[2])
+            if args[0] != "-c":
+                raise ValueError(f"Unexpected program argument {args[0]}")
+            # A failing job is only reported when the command line itself succeeded,
+            # so it does not hide the command line's own error
+            try:
+                self.run_command_line(args[1])
+            except Exception:
+                self.exit_jobs()
+                raise
+            self.finish_jobs()
         else:
             # Interactive shell
+            self.create_session()
             while True:
                 try:
                     # Use readline's prompt mechanism
@@ -48,11 +147,13 @@ class Comp0010Shell:
                     self.run_command_line(cmdline)
                 except EOFError:
                     # Exit the shell on Ctrl-D (EOF)
+                    self.exit_jobs()
                     print("End of file (EOF), exiting...")
                     print("The end")
                     break
                 except KeyboardInterrupt:
                     # Exit the shell on Ctrl-C (Interrupt)
+                    self.exit_jobs()
                     print("KeyboardInterrupted...")
                     print("The end")
                     break
@@ -63,4 +164,4 @@ class Comp0010Shell:
 # Create a shell class and run
 if __name__ == "__main__":
     shell = Comp0010Shell()
-    shell.run_shell()
+    sys.exit(shell.run_shell())
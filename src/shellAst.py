@@ -0,0 +1,66 @@
+# Typed nodes of a parsed command line, built by ShellCommandTransformer
+class Node:
+    __slots__ = ()
+
+    def __eq__(self, other):
+        if type(self) is not type(other):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+# One IO redirection, extended means a here document for input and append for output
+class Redirect(Node):
+    __slots__ = ("direction", "target", "extended")
+
+    def __init__(self, direction, target, extended=False):
+        self.direction = direction
+        self.target = target
+        self.extended = extended
+
+
+# Command substitution, the output of command replaces the backquoted part of a call
+class Substitution(Node):
+    __slots__ = ("before", "command", "after")
+
+    def __init__(self, before, command, after):
+        self.before = before
+        self.command = command
+        self.after = after
+
+
+# A single application call with its reconstructed command text
+class Call(Node):
+    __slots__ = ("command", "redirects", "substitution")
+
+    def __init__(self, command, redirects=(), substitution=None):
+        self.command = command
+        self.redirects = redirects
+        self.substitution = substitution
+
+
+# Commands connected by '|', each one reading the output of the previous one
+class Pipe(Node):
+    __slots__ = ("commands",)
+
+    def __init__(self, commands):
+        self.commands = commands
+
+
+# Commands separated by ';', executed one after another
+class Seq(Node):
+    __slots__ = ("commands",)
+
+    def __init__(self, commands):
+        self.commands = commands
+
+
+# A command started as a background job by '&', the rest of the line does not wait for it
+class Background(Node):
+    __slots__ = ("command",)
+
+    def __init__(self, command):
+        self.command = command
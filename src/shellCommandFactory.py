@@ -1,4 +1,6 @@
 from shellCommands import commandRegistry
+from shellOutput import FileSink
+from shellMemo import MEMO_CACHE
 
 
 # The class for command factory design
@@ -8,13 +10,14 @@ class CommandFactory:
         self.out = out
         self.extra_dict = extra_dict
 
-    # Handle the potential output direction
+    # Handle the potential output direction, the command then writes into the file
+    # while it runs instead of into the output of the command line
     def output_redirection(self):
-        output_file = self.extra_dict.get("outputFile")
-        if output_file is not None:
-            with open(output_file[0], "a" if output_file[1] else "w") as f:
-                f.writelines(self.out)
-                self.out.clear()
+        output_file = self.extra_dict.get("outputFile") if self.extra_dict else None
+        if output_file is None:
+            return None
+        self.out = FileSink(output_file[0], append=output_file[1])
+        return self.out
 
     # Parrse command into command name and arguments
     def parse_command(self):
@@ -28,11 +31,27 @@ class CommandFactory:
             args = tokens[1:]
         return commandname, args
 
+    # Resolve a command line ahead of execution, None leaves parse errors to execute()
+    @staticmethod
+    def resolve(cmdline):
+        try:
+            commandname, args = CommandFactory(cmdline, None, None).parse_command()
+        except ValueError:
+            return None
+        return commandname, commandRegistry.get(commandname), tuple(args)
+
     # Create corresponding classes for commands and execute
     def execute_command(self, commandname, args):
-        cmd_class = commandRegistry.get(commandname)
+        self.run_command(commandname, commandRegistry.get(commandname), args)
+
+    # Execute an already looked up command class, pure commands through the memo cache
+    def run_command(self, commandname, cmd_class, args):
         if cmd_class:
             try:
+                if MEMO_CACHE.memoizes(commandname):
+                    for chunk in MEMO_CACHE.chunks(commandname, cmd_class, args, self.extra_dict):
+                        self.out.extend(chunk)
+                    return
                 command_instance = cmd_class(args, self.out, self.extra_dict)
                 command_instance.execute()
             except Exception as e:
@@ -40,12 +59,45 @@ class CommandFactory:
         else:
             raise ValueError(f"Unknown application: {commandname}")
 
+    # Create the command and return its output chunks as they are produced
+    def chunk_command(self, commandname, cmd_class, args):
+        if cmd_class:
+            try:
+                if MEMO_CACHE.memoizes(commandname):
+                    yield from MEMO_CACHE.chunks(commandname, cmd_class, args, self.extra_dict)
+                else:
+                    yield from cmd_class(args, self.out, self.extra_dict).chunks()
+            except Exception as e:
+                raise ValueError(f"Failed '{commandname}' initialize: {e}")
+        else:
+            raise ValueError(f"Unknown application: {commandname}")
+
+    # Lazy counterpart of execute() for the commands feeding a pipe, out is only
+    # used as scratch space by commands that cannot stream
+    def chunks(self, resolved=None):
+        try:
+            if resolved is None:
+                commandname, args = self.parse_command()
+                resolved = (commandname, commandRegistry.get(commandname), args)
+            commandname, cmd_class, args = resolved
+            yield from self.chunk_command(commandname, cmd_class, list(args))
+        except Exception as e:
+            raise ValueError(f"Unexpected error: {e}\n")
+
     # Main function for command factory
-    def execute(self):
+    def execute(self, resolved=None):
+        sink = None
         try:
-            commandname, args = self.parse_command()
-            self.execute_command(commandname, args)
+            sink = self.output_redirection()
+            if resolved is None:
+                commandname, args = self.parse_command()
+                self.execute_command(commandname, args)
+            else:
+                commandname, cmd_class, args = resolved
+                self.run_command(commandname, cmd_class, list(args))
         except Exception as e:
+            if sink is not None:
+                sink.close(success=False)
             raise ValueError(f"Unexpected error: {e}\n")
-        finally:
-            self.output_redirection()
+        if sink is not None:
+            sink.close()
@@ -1,9 +1,37 @@
 import re
 import os
+import heapq
 from os import listdir
+from collections import deque
+from itertools import chain, islice
 from shellDecorator import commandRegister, unsafe_command_decorator, commandRegistry
-from shellFileProcessing import FileProcessingCommand
+from shellFileProcessing import FileProcessingCommand, CHUNK_SIZE, FILE_CACHE, decode_lines
 from shellExceptions import InvalidCommandlineArgument, ErrorExectuingApplication
+from shellJobs import JOBS
+from shellMemo import MEMO_CACHE
+
+
+# Per-chunk work of the CPU-bound commands, at module level so worker processes can run it
+def grep_chunk(pattern, filename, lines):
+    search = re.compile(pattern).search
+    if filename:
+        return [f"{filename}:{line}" for line in lines if search(line)]
+    return [line for line in lines if search(line)]
+
+
+# Lines in chunks end with a newline, so it is cut off and put back once per line
+def cut_chunk(ranges, lines):
+    slices = [slice(start, end if end else None) for start, end in ranges]
+    return [''.join([line[part] for part in slices]) + "\n" for line in [line[:-1] for line in lines]]
+
+
+# Patterns without special characters are searched for as bytes in mapped files
+def is_literal(pattern):
+    return bool(pattern) and not any(char in ".^$*+?{}[]\\|()\n\r" for char in pattern)
+
+
+def sort_chunk(reverse, lines):
+    return sorted(lines, reverse=reverse)
 
 
 # Handle the help message
@@ -27,12 +55,19 @@ class HelpCommand(FileProcessingCommand):
         cat [FILE]...: Concatenates and displays FILE(s), or stdin if no file is given
         echo [ARG]...: Prints arguments to stdout
         head -n [NUM] [FILE]: Displays first NUM lines of FILE, default is 10 lines
+        head -c [NUM] [FILE]: Displays first NUM bytes of FILE
         tail -n [NUM] [FILE]: Displays last NUM lines of FILE, default is 10 lines
+        tail -c [NUM] [FILE]: Displays last NUM bytes of FILE
         grep [PATTERN] [FILE]...: Searches for PATTERN in FILE(s) or stdin
         find [PATH] -name [PATTERN]: Searches PATH for files matching PATTERN
         sort [-r] [FILE]: Sorts FILE or stdin, -r for reverse order
         uniq [-i] [FILE]: Filters consecutive duplicate lines in FILE or stdin, -i for ignoring case
         cut -b [RANGES] [FILE]: Cuts out specified byte RANGES (numbers or ranges connected by '-') from FILE or stdin
+        [COMMAND] &: Runs COMMAND as a background job while the rest of the line goes on
+        wait [JOB]...: Waits for JOB(s), or all jobs, and outputs their results in job order
+        jobs: Lists the background jobs that have not been waited for
+        filecache [-c | -s MIB]: Shows the cached files, clears them (-c) or sets the cache size (-s, 0 turns it off)
+        memocache [-c]: Shows the entries, hits and misses of the memoized output, or clears it (-c)
         Unsafe version: '_' + command name (e.g. _pwd)
         """
         try:
@@ -57,7 +92,8 @@ class PwdCommand(FileProcessingCommand):
             raise ErrorExectuingApplication("pwd", e)
 
 
-# Handle the cd command
+# Handle the cd command. Jobs share the working directory of the shell, so a
+# background job cannot change it and a foreground cd waits for running jobs
 @commandRegister("cd")
 class CdCommand(FileProcessingCommand):
     def __init__(self, args, out, extra_dict):
@@ -67,6 +103,9 @@ class CdCommand(FileProcessingCommand):
         try:
             if len(self.args) != 1:
                 raise InvalidCommandlineArgument("cd")
+            if JOBS.current_job() is not None:
+                raise ValueError("Cannot cd inside a background job")
+            JOBS.settle()
             os.chdir(self.args[0])
         except Exception as e:
             raise ErrorExectuingApplication("cd", e)
@@ -128,68 +167,150 @@ class EchoCommand(FileProcessingCommand):
 
 # Read one File or standard input
 class LineBasedCommand(FileProcessingCommand):
+    # Options taking a count, with the attribute each one sets
+    counts = {"-n": "lineNum", "-c": "byteNum"}
+
     def __init__(self, args, out, extra_dict):
         super().__init__(args, out, extra_dict)
         self.lineNum = 10
+        self.byteNum = None
         self.fileName = None
 
     # Parse the arguments further
     def parse_args(self):
-        if len(self.args) > 1 and self.args[0] == '-n':
+        if len(self.args) > 1 and self.args[0] in self.counts:
             try:
-                self.lineNum = int(self.args[1])
+                setattr(self, self.counts[self.args[0]], int(self.args[1]))
                 self.fileName = self.args[2] if len(self.args) > 2 else None
             except ValueError:
                 raise InvalidCommandlineArgument("head/tail")
         elif self.args:
             self.fileName = self.args[0]
 
-    def process_lines(self, contents):
+    def process_chunks(self, chunks):
         raise NotImplementedError("Must be implemented by subclasses")
 
-    def execute(self):
+    # Files and other input are both read through chunks unless a subclass reads files itself
+    def process_contents(self, filename):
+        return self.process_chunks(self.chunk_contents(filename))
+
+    def chunks(self):
         self.parse_args()
         try:
-            contents = self.get_contents(self.fileName)
-            for line in self.process_lines(contents):
-                self.out.append(line if line.endswith("\n") else line + "\n")
+            for chunk in self.process_contents(self.fileName):
+                if chunk:
+                    yield chunk
         except Exception as e:
             raise ErrorExectuingApplication("head/tail", e)
 
 
 @commandRegister("head")
 class HeadCommand(LineBasedCommand):
-    def process_lines(self, contents):
-        return contents[:self.lineNum]
+    # Files are read only as far as the count. Up to a chunk of lines is read a line at a
+    # time, more lines come in chunks that stop being read once there are enough
+    def process_contents(self, filename):
+        if filename and "*" not in filename:
+            if self.byteNum is not None:
+                contents = self.read_first_bytes(filename, self.byteNum)
+                if contents is not None:
+                    return [contents]
+            elif 0 <= self.lineNum <= CHUNK_SIZE:
+                return [self.read_first_lines(filename, self.lineNum)]
+        return super().process_contents(filename)
+
+    def process_chunks(self, chunks):
+        if self.byteNum is not None:
+            yield self.first_bytes(chunks)
+            return
+        # A negative count holds back that many lines, which may be the last ones
+        if self.lineNum < 0:
+            held = deque()
+            for chunk in chunks:
+                held.extend(chunk)
+                ready = len(held) + self.lineNum
+                if ready > 0:
+                    yield [held.popleft() for _ in range(ready)]
+            return
+        remaining = self.lineNum
+        if remaining == 0:
+            return
+        for chunk in chunks:
+            if len(chunk) >= remaining:
+                yield chunk[:remaining]
+                return
+            remaining -= len(chunk)
+            yield chunk
+
+    # No more chunks are read once there are enough bytes, counted as UTF-8 like files are read
+    def first_bytes(self, chunks):
+        count = max(self.byteNum, 0)
+        kept, size = [], 0
+        chunks = iter(chunks)
+        while size < count:
+            chunk = next(chunks, None)
+            if chunk is None:
+                break
+            kept.append("".join(chunk).encode())
+            size += len(kept[-1])
+        return decode_lines(b"".join(kept)[:count], "ignore")
 
 
 @commandRegister("tail")
 class TailCommand(LineBasedCommand):
-    def process_lines(self, contents):
+    # Regular files are read back from their end, other input from its start
+    def process_contents(self, filename):
+        if filename:
+            if self.byteNum is not None:
+                contents = self.read_last_bytes(filename, self.byteNum)
+            else:
+                contents = self.read_last_lines(filename, self.lineNum)
+                contents = None if contents is None else self.last_lines(contents)
+            if contents is not None:
+                return [contents]
+        return super().process_contents(filename)
+
+    # Only the last lines are kept while reading
+    def process_chunks(self, chunks):
+        if self.byteNum is not None:
+            yield self.last_bytes(chunks)
+            return
+        yield self.last_lines(list(deque(chain.from_iterable(chunks), maxlen=max(self.lineNum, 0))))
+
+    # Counts past the start of the input are sliced as the whole input always was
+    def last_lines(self, contents):
         return contents[len(contents) - self.lineNum:]
 
+    # Only the chunks holding the last bytes are kept, as UTF-8 like files are read
+    def last_bytes(self, chunks):
+        count = max(self.byteNum, 0)
+        kept, size = deque(), 0
+        for chunk in chunks:
+            data = "".join(chunk).encode()
+            kept.append(data)
+            size += len(data)
+            while kept and size - len(kept[0]) >= count:
+                size -= len(kept.popleft())
+        data = b"".join(kept)
+        return decode_lines(data[max(len(data) - count, 0):], "ignore")
+
 
 @commandRegister("cat")
 class CatCommand(FileProcessingCommand):
     def __init__(self, args, out, extra_dict):
         super().__init__(args, out, extra_dict)
 
-    def execute(self):
+    def chunks(self):
         try:
-            contents = []
             if self.args:
                 for filename in self.args:
-                    contents.extend(self.read_file([filename]))
+                    yield from self.chunk_file([filename])
             else:
-                contents = self.read_stdin()
-
-            for line in contents:
-                self.out.append(line if line.endswith("\n") else line + "\n")
+                yield from self.chunk_stdin()
         except Exception as e:
             raise ErrorExectuingApplication("cat", e)
 
 
-@commandRegister("cut")
+@commandRegister("cut", pure=True)
 class CutCommand(FileProcessingCommand):
     def __init__(self, args, out, extra_dict):
         super().__init__(args, out, extra_dict)
@@ -222,25 +343,24 @@ class CutCommand(FileProcessingCommand):
                 merged[-1] = (part, None if end is None else max(merged[-1][1], end))
         return merged
 
-    def execute(self):
+    def chunks(self):
         if len(self.args) < 2 or self.args[0] != '-b':
             raise InvalidCommandlineArgument("cut")
 
         ranges = self.parse_ranges(self.args)
         filename = self.args[-1] if len(self.args) > 2 else None
         try:
-            contents = self.get_contents(filename)
-            for line in contents:
-                result = []
-                for start, end in ranges:
-                    result.append(line[start: end] if end else line[start:])
-                res = ''.join(result)
-                self.out.append(res if res.endswith("\n") else res + "\n")
+            chunks = self.chunk_contents(filename)
+            if self.pool is not None:
+                yield from self.pool.map(cut_chunk, (ranges,), chain.from_iterable(chunks))
+            else:
+                for chunk in chunks:
+                    yield cut_chunk(ranges, chunk)
         except Exception as e:
             raise ErrorExectuingApplication("cut", e)
 
 
-@commandRegister("uniq")
+@commandRegister("uniq", pure=True)
 class UniqCommand(FileProcessingCommand):
     def __init__(self, args, out, extra_dict):
         super().__init__(args, out, extra_dict)
@@ -257,22 +377,24 @@ class UniqCommand(FileProcessingCommand):
         if len(self.args) > valid_arg_num:
             raise InvalidCommandlineArgument("uniq")
 
-    def execute(self):
+    def chunks(self):
         try:
             self.parse_args()
-            contents = self.get_contents(self.filename)
-            # Compare each line with the previous line
+            # Compare each line with the previous line, which may be in the previous chunk
             last_line = None
-            for line in contents:
-                line_to_compare = line.lower() if self.ignore_case else line
-                if line_to_compare != last_line:
-                    self.out.append(line)
-                    last_line = line_to_compare
+            for chunk in self.chunk_contents(self.filename):
+                compared = [line.lower() for line in chunk] if self.ignore_case else chunk
+                previous = [last_line] + compared
+                unique = [line for line, line_to_compare, last in zip(chunk, compared, previous)
+                          if line_to_compare != last]
+                last_line = compared[-1]
+                if unique:
+                    yield unique
         except Exception as e:
             raise ErrorExectuingApplication("uniq", e)
 
 
-@commandRegister("sort")
+@commandRegister("sort", pure=True)
 class SortCommand(FileProcessingCommand):
     def __init__(self, args, out, extra_dict):
         super().__init__(args, out, extra_dict)
@@ -289,41 +411,67 @@ class SortCommand(FileProcessingCommand):
         if len(self.args) > valid_arg_num:
             raise InvalidCommandlineArgument("sort")
 
-    def execute(self):
+    # The sorted input is passed on as a single chunk
+    def chunks(self):
         try:
             self.parse_args()
-            contents = self.get_contents(self.filename)
-            self.out.extend(sorted(contents, reverse=self.reverse))
+            contents = chain.from_iterable(self.chunk_contents(self.filename))
+            if self.pool is not None:
+                # Chunks are sorted by the workers and merged here
+                chunks = list(self.pool.map(sort_chunk, (self.reverse,), contents))
+                result = list(heapq.merge(*chunks, reverse=self.reverse))
+            else:
+                result = sorted(contents, reverse=self.reverse)
+            if result:
+                yield result
         except Exception as e:
             raise ErrorExectuingApplication("sort", e)
 
 
 # Read multiple Files or standard input
-@commandRegister("grep")
+@commandRegister("grep", pure=True)
 class GrepCommand(FileProcessingCommand):
     def __init__(self, args, out, extra_dict):
         super().__init__(args, out, extra_dict)
 
     def grep_files(self, pattern, filenames):
-        contents = self.read_multiple_files(filenames, True)
-        isMultipleFiles = len(contents) > 1
-        for file in contents:
-            filename = file[0]
-            if isMultipleFiles:
-                self.grep_and_append(file[1:], pattern, filename)
+        filenames = self.expand_globbing(filenames)
+        isMultipleFiles = len(filenames) > 1
+        literal = is_literal(pattern)
+        for filename in filenames:
+            label = filename if isMultipleFiles else None
+            mapped = self.map_file(filename) if literal else None
+            if mapped is not None:
+                yield from self.grep_mapped(mapped, pattern, label)
             else:
-                self.grep_and_append(file, pattern)
+                yield from self.grep_chunks(self.chunk_file([filename]), pattern, label)
+
+    # Only the lines holding the pattern are decoded
+    def grep_mapped(self, mapped, pattern, filename=None):
+        prefix = f"{filename}:" if filename else ""
+        with mapped:
+            lines = mapped.find_lines(pattern.encode())
+            while True:
+                chunk = [prefix + line.decode() for line in islice(lines, CHUNK_SIZE)]
+                if not chunk:
+                    return
+                yield chunk
 
     def grep_stdin(self, pattern):
-        contents = self.read_stdin()
-        self.grep_and_append(contents, pattern)
+        return self.grep_chunks(self.chunk_stdin(), pattern)
 
-    def grep_and_append(self, contents, pattern, filename=None):
-        for line in contents:
-            if re.search(pattern, line):
-                self.out.append(f"{filename}:{line}" if filename else line)
+    # Chunks left empty by the pattern are dropped
+    def grep_chunks(self, chunks, pattern, filename=None):
+        re.compile(pattern)
+        if self.pool is not None:
+            results = self.pool.map(grep_chunk, (pattern, filename), chain.from_iterable(chunks))
+        else:
+            results = (grep_chunk(pattern, filename, chunk) for chunk in chunks)
+        for lines in results:
+            if lines:
+                yield lines
 
-    def execute(self):
+    def chunks(self):
         if len(self.args) < 1:
             raise InvalidCommandlineArgument("grep")
 
@@ -331,14 +479,14 @@ class GrepCommand(FileProcessingCommand):
         filenames = self.args[1:]
         try:
             if filenames:
-                self.grep_files(pattern, filenames)
+                yield from self.grep_files(pattern, filenames)
             else:
-                self.grep_stdin(pattern)
+                yield from self.grep_stdin(pattern)
         except Exception as e:
             raise ErrorExectuingApplication("grep", e)
 
 
-@commandRegister("find")
+@commandRegister("find", pure=True)
 class FindCommand(FileProcessingCommand):
     def __init__(self, args, out, extra_dict):
         super().__init__(args, out, extra_dict)
@@ -365,6 +513,78 @@ class FindCommand(FileProcessingCommand):
             self.out.append(filename + "\n")
 
 
+# Wait for background jobs, given by number with an optional '%'
+@commandRegister("wait")
+class WaitCommand(FileProcessingCommand):
+    def __init__(self, args, out, extra_dict):
+        super().__init__(args, out, extra_dict)
+
+    def parse_args(self):
+        try:
+            return [int(arg[1:] if arg.startswith("%") else arg) for arg in self.args]
+        except ValueError:
+            raise InvalidCommandlineArgument("wait")
+
+    def execute(self):
+        numbers = self.parse_args()
+        try:
+            JOBS.wait(self.out, numbers)
+        except Exception as e:
+            raise ErrorExectuingApplication("wait", e)
+
+
+@commandRegister("jobs")
+class JobsCommand(FileProcessingCommand):
+    def __init__(self, args, out, extra_dict):
+        super().__init__(args, out, extra_dict)
+
+    def execute(self):
+        if self.args:
+            raise InvalidCommandlineArgument("jobs")
+        self.out.extend(JOBS.list())
+
+
+# Show, clear or resize the session's cache of file contents
+@commandRegister("filecache")
+class FileCacheCommand(FileProcessingCommand):
+    def __init__(self, args, out, extra_dict):
+        super().__init__(args, out, extra_dict)
+
+    def execute(self):
+        if not self.args:
+            info = FILE_CACHE.info()
+            self.out.append(f"files: {info['files']}, size: {info['size']}/{info['maxbytes']} bytes, "
+                            f"hits: {info['hits']}, misses: {info['misses']}\n")
+            self.out.extend(FILE_CACHE.list())
+        elif self.args == ["-c"]:
+            FILE_CACHE.clear()
+        elif len(self.args) == 2 and self.args[0] == "-s":
+            try:
+                size = int(self.args[1])
+            except ValueError:
+                raise InvalidCommandlineArgument("filecache")
+            FILE_CACHE.resize(max(size, 0) << 20)
+        else:
+            raise InvalidCommandlineArgument("filecache")
+
+
+# Show or clear the session's memoized command output
+@commandRegister("memocache")
+class MemoCacheCommand(FileProcessingCommand):
+    def __init__(self, args, out, extra_dict):
+        super().__init__(args, out, extra_dict)
+
+    def execute(self):
+        if not self.args:
+            info = MEMO_CACHE.info()
+            self.out.append(f"entries: {info['size']}/{info['maxsize']}, "
+                            f"hits: {info['hits']}, misses: {info['misses']}\n")
+        elif self.args == ["-c"]:
+            MEMO_CACHE.clear()
+        else:
+            raise InvalidCommandlineArgument("memocache")
+
+
 # Unsafe versions
 @commandRegister("_pwd")
 class UnsafePwdCommand(unsafe_command_decorator(PwdCommand)):
@@ -401,26 +621,46 @@ class UnsafeCatCommand(unsafe_command_decorator(CatCommand)):
     pass
 
 
-@commandRegister("_cut")
+@commandRegister("_cut", pure=True)
 class UnsafeCutCommand(unsafe_command_decorator(CutCommand)):
     pass
 
 
-@commandRegister("_uniq")
+@commandRegister("_uniq", pure=True)
 class UnsafeUniqCommand(unsafe_command_decorator(UniqCommand)):
     pass
 
 
-@commandRegister("_sort")
+@commandRegister("_sort", pure=True)
 class UnsafeSortCommand(unsafe_command_decorator(SortCommand)):
     pass
 
 
-@commandRegister("_grep")
+@commandRegister("_grep", pure=True)
 class UnsafeGrepCommand(unsafe_command_decorator(GrepCommand)):
     pass
 
 
-@commandRegister("_find")
+@commandRegister("_find", pure=True)
 class UnsafeFindCommand(unsafe_command_decorator(FindCommand)):
     pass
+
+
+@commandRegister("_wait")
+class UnsafeWaitCommand(unsafe_command_decorator(WaitCommand)):
+    pass
+
+
+@commandRegister("_jobs")
+class UnsafeJobsCommand(unsafe_command_decorator(JobsCommand)):
+    pass
+
+
+@commandRegister("_filecache")
+class UnsafeFileCacheCommand(unsafe_command_decorator(FileCacheCommand)):
+    pass
+
+
+@commandRegister("_memocache")
+class UnsafeMemoCacheCommand(unsafe_command_decorator(MemoCacheCommand)):
+    pass
@@ -1,11 +1,17 @@
 # Registry for command classes
 commandRegistry = {}
 
+# Commands whose output only depends on their arguments, input and the files they
+# read, so it can be reused while those stay the same
+pureCommands = set()
+
 
 # Class decorators to register command classes
-def commandRegister(commandName):
+def commandRegister(commandName, pure=False):
     def decorator(cls):
         commandRegistry[commandName] = cls
+        if pure:
+            pureCommands.add(commandName)
         return cls
     return decorator
 
@@ -17,4 +23,16 @@ def unsafe_command_decorator(cls):
                 super().execute()
             except Exception as e:
                 self.out.append(f"Error: {str(e)}\n")
+
+        def chunks(self):
+            try:
+                yield from super().chunks()
+            except Exception as e:
+                yield [f"Error: {str(e)}\n"]
+
+        def stream(self):
+            try:
+                yield from super().stream()
+            except Exception as e:
+                yield f"Error: {str(e)}\n"
     return UnsafeCommand
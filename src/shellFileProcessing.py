@@ -1,7 +1,224 @@
 import sys
 import os
+import mmap
+import codecs
+import locale
+import time
+import threading
+from stat import S_ISREG
 from glob import glob
 import fnmatch
+from collections import OrderedDict
+from itertools import chain, islice
+
+# Commands hand lines to each other in chunks: non-empty lists of up to CHUNK_SIZE
+# lines, every line ending with a newline. Files are read READ_SIZE characters at a
+# time through a buffer of the same size, so their chunks are as long as the lines
+# that fit
+CHUNK_SIZE = 1024
+READ_SIZE = 1 << 16
+
+# Some commands read files as bytes, which only matches the text when files are read
+# as UTF-8, where a newline byte always ends a line
+BYTES_ENCODING = codecs.lookup(locale.getpreferredencoding(False)).name == "utf-8"
+
+# Regular files of at least MMAP_SIZE bytes are mapped into memory for commands that
+# can search their bytes, such as grep with a literal pattern. COMP0010_MMAP=0 turns it off
+MMAP_ENABLED = os.environ.get("COMP0010_MMAP", "1") != "0"
+MMAP_SIZE = 1 << 24
+
+# Most MiB of memory the decoded lines of files kept for the session may take, off
+# unless COMP0010_FILE_CACHE sets it. Files changed within FILE_CACHE_SETTLE seconds of
+# being read are not kept, as their times come from a coarse clock, see MEMO_SETTLE
+FILE_CACHE_SIZE = int(os.environ.get("COMP0010_FILE_CACHE", "0")) << 20
+FILE_CACHE_SETTLE = 2.0
+
+
+# Output of a pipeline stage as the next stage receives it, iterating gives the lines
+class Chunks:
+    __slots__ = ("chunks",)
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def __iter__(self):
+        return chain.from_iterable(self.chunks)
+
+
+# Lines of bytes read from a file, decoded and each ending with a newline
+def decode_lines(data, errors="strict"):
+    lines = data.decode(errors=errors).split("\n")
+    last = lines.pop()
+    lines = [line + "\n" for line in lines]
+    if last:
+        lines.append(last + "\n")
+    return lines
+
+
+# Offset of the last count lines of a file opened in binary mode, found by reading
+# blocks of READ_SIZE bytes back from the end. None when a block has a carriage
+# return, which text mode reads as a newline
+def find_last_lines(file, count):
+    end = position = file.seek(0, os.SEEK_END)
+    if count <= 0:
+        return end
+    remaining = count
+    while position > 0:
+        start = max(position - READ_SIZE, 0)
+        file.seek(start)
+        block = file.read(position - start)
+        if b"\r" in block:
+            return None
+        # A newline at the end of the file ends the last line rather than starting one
+        stop = len(block) - 1 if position == end and block.endswith(b"\n") else len(block)
+        index = block.rfind(b"\n", 0, stop)
+        while index >= 0:
+            remaining -= 1
+            if remaining == 0:
+                return start + index + 1
+            index = block.rfind(b"\n", 0, index)
+        position = start
+    return 0
+
+
+# Read-only mapping of a file. It is searched in place, and only the lines that are
+# used are copied out of it. Commands that need every line read the file as text
+# instead, which is faster than decoding blocks of the mapping
+class MappedFile:
+    __slots__ = ("mapping",)
+
+    def __init__(self, file):
+        self.mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return len(self.mapping)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.mapping.close()
+
+    # Each line containing the bytes once, with a newline added to a last line without one
+    def find_lines(self, literal):
+        mapping = self.mapping
+        index = mapping.find(literal)
+        while index >= 0:
+            start = mapping.rfind(b"\n", 0, index) + 1
+            stop = mapping.find(b"\n", index)
+            if stop < 0:
+                yield mapping[start:] + b"\n"
+                return
+            yield mapping[start:stop + 1]
+            index = mapping.find(literal, stop + 1)
+
+
+# Memory taken by a cached chunk, the tuple and the decoded lines in it
+def chunk_size(chunk):
+    return sys.getsizeof(chunk) + sum(map(sys.getsizeof, chunk))
+
+
+# Bounded LRU cache of the chunks of files read to the end, keyed on their absolute
+# path. An entry is only used while the file has the inode, modification time and
+# size it had when read, and entries are evicted by the total memory of their chunks
+class FileCache:
+    def __init__(self, maxbytes=FILE_CACHE_SIZE):
+        self.maxbytes = maxbytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def enabled(self):
+        return self.maxbytes > 0
+
+    def get(self, path, saved):
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is not None:
+                if entry[0] == saved:
+                    self.entries.move_to_end(path)
+                    self.hits += 1
+                    return entry[1]
+                self.remove(path)
+            self.misses += 1
+            return None
+
+    def put(self, path, saved, chunks, size):
+        with self.lock:
+            if path in self.entries:
+                self.remove(path)
+            self.entries[path] = (saved, chunks, size)
+            self.size += size
+            self.evict()
+
+    def remove(self, path):
+        _, _, size = self.entries.pop(path)
+        self.size -= size
+
+    def evict(self):
+        while self.size > self.maxbytes:
+            self.remove(next(iter(self.entries)))
+
+    def resize(self, maxbytes):
+        with self.lock:
+            self.maxbytes = maxbytes
+            self.evict()
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+            self.hits = 0
+            self.misses = 0
+
+    def info(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "files": len(self.entries),
+                    "size": self.size, "maxbytes": self.maxbytes}
+
+    # The cached files and the memory they take, least recently used first
+    def list(self):
+        with self.lock:
+            return [f"{size} {path}\n" for path, (_, _, size) in self.entries.items()]
+
+    # Chunks of an open file, from the cache or from reading it. The decoded lines
+    # take more memory than the file, so a file is dropped once they outgrow the cache
+    def chunks(self, file, chunks):
+        try:
+            stat = os.fstat(file.fileno())
+            path = os.path.abspath(file.name)
+        except (OSError, TypeError, ValueError):
+            yield from chunks
+            return
+        saved = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        cached = self.get(path, saved)
+        if cached is not None:
+            for chunk in cached:
+                yield list(chunk)
+            return
+
+        settled = time.time_ns() - stat.st_mtime_ns >= FILE_CACHE_SETTLE * 1e9
+        output = [] if S_ISREG(stat.st_mode) and stat.st_size <= self.maxbytes and settled else None
+        size = 0
+        for chunk in chunks:
+            if output is not None:
+                output.append(tuple(chunk))
+                size += chunk_size(output[-1])
+                if size > self.maxbytes:
+                    output = None
+            yield chunk
+        if output is not None:
+            output = tuple(output)
+            self.put(path, saved, output, size + sys.getsizeof(output))
+
+
+# Shared by every command line of the session
+FILE_CACHE = FileCache()
 
 
 class FileProcessingCommand:
@@ -10,36 +227,194 @@ class FileProcessingCommand:
         self.out = out
         self.inputFile = extra_dict.get("inputFile")
         self.contents = extra_dict.get("contents")
+        # Worker processes for CPU-bound work, when the pipeline runs with them
+        self.pool = extra_dict.get("pool")
+        # Collects what the command reads when its output is memoized
+        self.reads = extra_dict.get("reads")
+
+    # Commands override one of execute, chunks or stream and get the others from it.
+    # Commands that can work on part of their input implement chunks
+    def execute(self):
+        for chunk in self.chunks():
+            self.out.extend(chunk)
+
+    def chunks(self):
+        return self.chunk_lines(self.stream())
+
+    def stream(self):
+        self.execute()
+        yield from self.out
 
     def contents_with_newline(self, contents):
         if contents and not contents[-1].endswith("\n"):
             contents[-1] += "\n"
         return contents
 
+    # Path None is input that cannot be checked for changes
+    def record_read(self, path, file=None):
+        if self.reads is not None:
+            self.reads.add(path, file)
+
     def expand_globbing(self, args):
         expanded_args = []
         for arg in args:
             if "*" in arg:
+                # The matches change with the directory, which is only known without wildcards
+                directory = os.path.dirname(arg) or "."
+                self.record_read(None if "*" in directory else directory)
                 expanded_args.extend(glob(arg))
             else:
                 expanded_args.append(arg)
         return expanded_args
 
+    # All lines of the files in a list, read through the same reader as chunk_file
     def read_file(self, filename, name=False):
         filenames = self.expand_globbing(filename)
         fileContents = []
         for filename in filenames:
+            lines = list(self.stream_file([filename]))
+            if name:
+                lines.insert(0, filename)
+                fileContents.append(lines)
+            else:
+                fileContents.extend(lines)
+        return fileContents
+
+    def open_file(self, filename):
+        try:
+            file = open(filename, 'r', buffering=READ_SIZE)
+        except IOError as e:
+            self.record_read(filename)
+            raise ValueError(f"Error reading file: {e}")
+        self.record_read(filename, file)
+        return file
+
+    # The file mapped when it is a regular file of at least MMAP_SIZE bytes, otherwise
+    # None and it is read as text. Files with carriage returns are read as text too,
+    # which turns them into newlines. Missing files are reported when read as text
+    def map_file(self, filename):
+        if not MMAP_ENABLED or not BYTES_ENCODING or "*" in filename:
+            return None
+        try:
+            stat = os.stat(filename)
+            if not S_ISREG(stat.st_mode) or stat.st_size < MMAP_SIZE:
+                return None
+            with open(filename, 'rb') as file:
+                mapped = MappedFile(file)
+                if mapped.mapping.find(b"\r") >= 0:
+                    mapped.close()
+                    return None
+                self.record_read(filename, file)
+                return mapped
+        except (OSError, ValueError):
+            return None
+
+    # A regular file opened in binary mode to be read from anywhere, or None and it is
+    # read as text from the start. Missing files are reported when read as text
+    def open_binary(self, filename):
+        if not BYTES_ENCODING or "*" in filename:
+            return None
+        try:
+            if not S_ISREG(os.stat(filename).st_mode):
+                return None
+            file = open(filename, 'rb')
+        except OSError:
+            return None
+        self.record_read(filename, file)
+        return file
+
+    # Lines from the start of the last count lines of a file to its end, or None
+    def read_last_lines(self, filename, count):
+        file = self.open_binary(filename)
+        if file is None:
+            return None
+        with file:
             try:
-                with open(filename, 'r') as file:
-                    lines = self.contents_with_newline(file.readlines())
-                    if name:
-                        lines.insert(0, filename)
-                        fileContents.append(lines)
-                    else:
-                        fileContents.extend(lines)
+                start = find_last_lines(file, count)
+                if start is None:
+                    return None
+                file.seek(start)
+                return decode_lines(file.read())
             except IOError as e:
                 raise ValueError(f"Error reading file: {e}")
-        return fileContents
+
+    # The first count lines of a file, read one at a time so nothing after them is decoded
+    def read_first_lines(self, filename, count):
+        with self.open_file(filename) as file:
+            try:
+                lines = list(islice(file, max(count, 0)))
+            except IOError as e:
+                raise ValueError(f"Error reading file: {e}")
+        return self.contents_with_newline(lines)
+
+    # The first count bytes of a file as lines, a character cut by the end is dropped
+    def read_first_bytes(self, filename, count):
+        file = self.open_binary(filename)
+        if file is None:
+            return None
+        with file:
+            try:
+                data = file.read(max(count, 0))
+            except IOError as e:
+                raise ValueError(f"Error reading file: {e}")
+        if b"\r" in data:
+            return None
+        return decode_lines(data, "ignore")
+
+    # The last count bytes of a file as lines, a character cut by the start is dropped
+    def read_last_bytes(self, filename, count):
+        file = self.open_binary(filename)
+        if file is None:
+            return None
+        with file:
+            try:
+                end = file.seek(0, os.SEEK_END)
+                file.seek(max(end - max(count, 0), 0))
+                data = file.read()
+            except IOError as e:
+                raise ValueError(f"Error reading file: {e}")
+        if b"\r" in data:
+            return None
+        return decode_lines(data, "ignore")
+
+    # Lazily read the chunks of the given files one after another. The first file is
+    # opened before returning, so a missing file is reported even if nothing is read
+    def chunk_file(self, filename):
+        filenames = self.expand_globbing(filename)
+        first = self.open_file(filenames[0]) if filenames else None
+        return self.chunk_files(first, filenames[1:])
+
+    # Files that are still the same as when they were cached are not read again
+    def chunk_files(self, file, filenames):
+        remaining = iter(filenames)
+        while file is not None:
+            with file:
+                chunks = self.read_chunks(file)
+                yield from FILE_CACHE.chunks(file, chunks) if FILE_CACHE.enabled() else chunks
+            filename = next(remaining, None)
+            file = self.open_file(filename) if filename is not None else None
+
+    # Only the last line of a file can lack its newline, so one check per chunk is enough
+    def read_chunks(self, file):
+        try:
+            for chunk in iter(lambda: file.readlines(READ_SIZE), []):
+                if not chunk[-1].endswith("\n"):
+                    chunk[-1] += "\n"
+                yield chunk
+        except IOError as e:
+            raise ValueError(f"Error reading file: {e}")
+
+    def stream_file(self, filename):
+        return chain.from_iterable(self.chunk_file(filename))
+
+    # Group lines from a source without chunks, adding the newlines they miss
+    def chunk_lines(self, lines):
+        lines = iter(lines)
+        while True:
+            chunk = [line if line.endswith("\n") else line + "\n" for line in islice(lines, CHUNK_SIZE)]
+            if not chunk:
+                return
+            yield chunk
 
     def read_multiple_files(self, match_name, contents, directory=None):
         if not match_name:
@@ -51,8 +426,10 @@ class FileProcessingCommand:
         else:
             # Set the base directory for searching
             baseDir = directory if directory else os.getcwd()
+            self.record_read(baseDir)
             # Walk through the directory tree
             for root, _, files in os.walk(baseDir):
+                self.record_read(root)
                 for pattern in match_name:
                     for filename in fnmatch.filter(files, pattern):
                         fullPath = os.path.join(root, filename)
@@ -64,6 +441,7 @@ class FileProcessingCommand:
         return fileContents
 
     def read_from_stdin(self, detect_string=None):
+        self.record_read(None)
         stdin = []
         try:
             for line in sys.stdin:
@@ -74,29 +452,34 @@ class FileProcessingCommand:
             raise ValueError("Error reading from stdin")
         return self.contents_with_newline(stdin)
 
-    def read_stdin(self):
-        # Process the contents from the previous command
-        if self.contents:
-            return self.contents_with_newline(self.contents)
+    # Lists from callers keep the rule that an empty list means no piped input,
+    # any other contents is a lazy stream from the previous pipeline stage
+    def has_contents(self):
+        if isinstance(self.contents, list):
+            return bool(self.contents)
+        return self.contents is not None
+
+    # Chunks from a previous pipeline stage are passed on as they are
+    def chunk_stdin(self):
+        if isinstance(self.contents, Chunks):
+            return iter(self.contents.chunks)
+        if self.has_contents():
+            return self.chunk_lines(self.contents)
 
-        # Deal with Input Redirection and Here Documents
         if self.inputFile:
             if self.inputFile[1]:
-                return self.read_from_stdin(self.inputFile[0])
+                return self.chunk_lines(self.read_from_stdin(self.inputFile[0]))
             else:
-                return self.read_file([self.inputFile[0]])
+                return self.chunk_file([self.inputFile[0]])
 
-        # Nornally read from stdin
-        return self.read_from_stdin()
+        self.record_read(None)
+        return self.chunk_lines(sys.stdin)
 
-    def get_contents(self, filename):
+    # Chunks of the named file or of the input, empty input gives no chunks rather than an error
+    def chunk_contents(self, filename):
         if filename:
-            contents = self.read_file([filename])
-        else:
-            contents = self.read_stdin()
-        last = contents[-1]
-        contents[-1] = last if last.endswith("\n") else last + "\n"
-        return contents
+            return self.chunk_file([filename])
+        return self.chunk_stdin()
 
     def handle_exceptions(self, operation):
         try:
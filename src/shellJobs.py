@@ -0,0 +1,116 @@
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures
+from shellAst import Call, Pipe
+
+# Threads running background jobs, the executor's default when not set
+JOB_WORKERS = int(os.environ.get("COMP0010_JOB_WORKERS", 0)) or None
+
+REDIRECT_OPERATORS = {("input", False): "<", ("input", True): "<<",
+                      ("output", False): ">", ("output", True): ">>"}
+
+
+# Command text of a job as listed by jobs
+def describe(node):
+    if isinstance(node, Pipe):
+        return " | ".join(describe(call) for call in node.commands)
+    if isinstance(node, Call):
+        redirects = (f" {REDIRECT_OPERATORS[(r.direction, r.extended)]} {r.target}" for r in node.redirects)
+        return node.command + "".join(redirects)
+    return repr(node)
+
+
+# A background job, its output is kept in its own buffer until it is waited for
+class Job:
+    def __init__(self, number, text):
+        self.number = number
+        self.text = text
+        self.out = deque()
+        self.future = None
+
+    def status(self):
+        if not self.future.done():
+            return "Running"
+        return "Failed" if self.future.exception() is not None else "Done"
+
+
+# Jobs of the session, run on a thread pool that is started on first use. Waiting
+# collects their output in job order, whatever order they finish in
+class JobTable:
+    def __init__(self, workers=JOB_WORKERS):
+        self.workers = workers
+        self.pool = None
+        self.jobs = {}
+        self.lock = threading.Lock()
+        # Set on the threads running jobs
+        self.current = threading.local()
+
+    def executor(self):
+        if self.pool is None:
+            self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job")
+        return self.pool
+
+    def submit(self, plan, text):
+        with self.lock:
+            number = max(self.jobs, default=0) + 1
+            job = self.jobs[number] = Job(number, text)
+            job.future = self.executor().submit(self.run, job, plan)
+        return job
+
+    def run(self, job, plan):
+        self.current.job = job
+        try:
+            plan.run(job.out)
+        finally:
+            self.current.job = None
+
+    # The job running on this thread, None in the foreground. Threads started by a
+    # job, like pipeline stages, set it to the job that started them
+    def current_job(self):
+        return getattr(self.current, "job", None)
+
+    # Wait for the given job numbers, or every job, and append their output in job
+    # order. Output of failed jobs is kept, and the first failure is raised after it
+    def wait(self, out, numbers=None):
+        if self.current_job() is not None:
+            raise ValueError("Cannot wait inside a background job")
+        with self.lock:
+            for number in numbers or ():
+                if number not in self.jobs:
+                    raise ValueError(f"No such job: {number}")
+            selected = sorted(set(numbers or self.jobs))
+
+        failure = None
+        for number in selected:
+            job = self.jobs[number]
+            try:
+                job.future.result()
+            except Exception as e:
+                failure = failure or f"Job [{number}] failed: {e}"
+            out.extend(job.out)
+            with self.lock:
+                del self.jobs[number]
+        if failure is not None:
+            raise ValueError(failure)
+
+    # Block until every job has finished, keeping their output for wait. Jobs resolve
+    # their paths against the shell's working directory, so cd runs after this
+    def settle(self):
+        with self.lock:
+            futures = [job.future for job in self.jobs.values()]
+        wait_futures(futures)
+
+    def list(self):
+        with self.lock:
+            jobs = sorted(self.jobs.items())
+        return [f"[{number}] {job.status()} {job.text}\n" for number, job in jobs]
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+
+# Shared by every command line of the session
+JOBS = JobTable()
@@ -1,75 +1,151 @@
-from lark import Lark, Transformer
+import os
+import re
+import sys
+import pickle
+import hashlib
+import lark
+from lark import Lark, Transformer, Token
+from lark.exceptions import UnexpectedInput, VisitError
+from lark.load_grammar import load_grammar
+from shellAst import Redirect, Substitution, Call, Pipe, Seq, Background
 
 
-# Define the transformer to process the parse tree
+# Quote characters kept around quotes nested inside other quotes
+QUOTE_CHARS = {"single": "'", "double": '"', "back": "`"}
+
+# Runs of whitespace in unquoted text collapse to a single space
+WHITESPACE = re.compile(r"\s+")
+
+
+# A call with nothing in it, as left after a trailing ';' or '&'
+def is_empty(command):
+    return isinstance(command, Call) and not command.command and not command.redirects \
+        and command.substitution is None
+
+
+# Define the transformer to build the command line AST in a single pass.
+# Quotes become (kind, text, backquote) fragments, where backquote is the
+# content of the last backquoted part inside them, until a call joins them.
 class ShellCommandTransformer(Transformer):
-    # Define methods for each grammar rule
     def command(self, args):
-        return {"command": args}
+        return args[0]
 
+    # '&' turns the command before it into a background job, and a trailing '&'
+    # leaves an empty call that is dropped
     def seq(self, args):
-        return {"seq": args}
+        commands = []
+        for arg in args:
+            if isinstance(arg, Token):
+                if is_empty(commands[-1]):
+                    raise ValueError("Missing command before '&'")
+                commands[-1] = Background(commands[-1])
+            else:
+                commands.append(arg)
+        if isinstance(commands[-2], Background) and is_empty(commands[-1]):
+            commands.pop()
+        return commands[0] if len(commands) == 1 else Seq(tuple(commands))
+
+    def pipe(self, args):
+        # Only the last call of a pipeline may redirect its output
+        for call in args[:-1]:
+            if any(r.direction == "output" for r in call.redirects):
+                raise ValueError("Output redirection in the middle of a pipeline")
+        return Pipe(tuple(args))
 
     def call(self, args):
-        return {"call": args}
+        parts = []
+        redirects = []
+        backquote = None
+        disqualified = False
+        for arg in args:
+            if isinstance(arg, str):
+                parts.append(arg)
+            elif isinstance(arg, Redirect):
+                redirects.append(arg)
+            else:
+                kind, text, inner_backquote = arg
+                parts.append("`" + text + "`" if kind == "back" else text)
+                if inner_backquote is not None:
+                    backquote = inner_backquote
+                    # Backquotes inside single quotes are not substituted
+                    disqualified = disqualified or kind == "single"
 
-    def pipe(self, args):
-        return {"pipe": args}
+        reconstructed = "".join(parts)
+        if not backquote:
+            return Call(reconstructed.strip(" \t"), tuple(redirects))
+
+        substitution = None
+        if not disqualified:
+            before, _, after = reconstructed.partition("`" + backquote + "`")
+            substituted = larkParser(LARK_GRAMMAR, backquote)
+            substitution = Substitution(before.lstrip(" \t"), substituted, after.rstrip(" \t"))
+        return Call(reconstructed.lstrip(" \t"), tuple(redirects), substitution)
+
+    def normal(self, args):
+        return WHITESPACE.sub(" ", args[0])
+
+    # Join the contents of a quote, nested quotes keep their quote characters
+    def quote_contents(self, args):
+        contents = []
+        backquote = None
+        for arg in args:
+            if isinstance(arg, str):
+                contents.append(arg)
+            else:
+                kind, text, inner_backquote = arg
+                contents.append(QUOTE_CHARS[kind] + text + QUOTE_CHARS[kind])
+                if inner_backquote is not None:
+                    backquote = inner_backquote
+        return "".join(contents), backquote
 
     def quoted(self, args):
-        return {"quoted": args}
+        return args[0]
 
     def singlequoted(self, args):
-        content = []
-        for arg in args:
-            content.append(arg)
-        return {"single_quoted": content}
+        return ("single",) + self.quote_contents(args)
 
     def doublequoted(self, args):
-        content = []
-        for arg in args:
-            content.append(arg)
-        return {"double_quoted": content}
+        return ("double",) + self.quote_contents(args)
 
     def backquoted(self, args):
-        content = []
-        for arg in args:
-            content.append(arg)
-        return {"backquoted": content}
+        text, inner_backquote = self.quote_contents(args)
+        # Nested backquotes not allowed
+        if inner_backquote is not None:
+            raise ValueError("Invalid command substitution syntax")
+        return ("back", text, text)
 
     def inner(self, args):
-        return {"inner": args}
-
-    def normal(self, args):
-        return {"normal": args}
+        return str(args[0])
 
     def io_redirection(self, args):
-        return {"io_redirection": args}
+        return args[0]
 
     def input_redirection(self, args):
-        return {"input_redirection": args}
+        return Redirect("input", args[0])
 
     def output_redirection(self, args):
-        return {"output_redirection": args}
+        return Redirect("output", args[0])
 
     def heredoc_redirection(self, args):
-        return {"heredoc_redirection": args}
+        return Redirect("input", args[0], True)
 
     def append_redirection(self, args):
-        return {"append_redirection": args}
+        return Redirect("output", args[0], True)
 
-    def FILENAME(self, args):
-        return {"FILENAME": args}
+    def filename(self, args):
+        return str(args[0])
 
 
 # Define the grammar for the parsing command line
 LARK_GRAMMAR = r"""
     command: pipe | seq | call
-    seq: command ";" _WS? command
+    seq: single ((";" | AMP) _WS? single)+
+    single: pipe -> command
+          | call -> command
     call: (normal | quoted | io_redirection)*
-    pipe: (call "|" _WS? call) | (pipe "|" _WS? call)
+    pipe: call ("|" _WS? call)+
 
-    normal: /[^\n'\"`;|<>]+/
+    normal: /[^\n'\"`;|<>&]+/
 
     quoted: singlequoted | doublequoted | backquoted
     singlequoted: "'" (inner | doublequoted | backquoted)* "'"
@@ -86,6 +162,8 @@ LARK_GRAMMAR = r"""
 
     filename: /[\w\.\-\/]+/
 
+    AMP: "&"
+
     _WS: /[ \t]+/
 
     %import common.WS
@@ -93,14 +171,139 @@ LARK_GRAMMAR = r"""
     %ignore NEWLINE
 """
 
+# LALR(1) version of LARK_GRAMMAR for the contextual lexer, producing the same trees.
+# Quotes nested inside quotes get their own rules so that LALR does not merge their
+# states with top-level quotes, and _WS outranks normal text right after an operator.
+LALR_GRAMMAR = r"""
+    command: pipe | seq | call
+    seq: single ((";" | AMP) _WS? single)+
+    single: pipe -> command
+          | call -> command
+    call: (normal | quoted | io_redirection)*
+    pipe: call ("|" _WS? call)+
+
+    normal: /[^\n'\"`;|<>&]+/
+
+    quoted: singlequoted | doublequoted | backquoted
+    singlequoted: "'" (inner | nested_doublequoted | nested_backquoted)* "'"
+    doublequoted: "\"" (inner | nested_singlequoted | nested_backquoted)* "\""
+    backquoted: "`" (inner | nested_singlequoted | nested_doublequoted)* "`"
 
-def larkParser(grammar, cmdline):
+    nested_singlequoted: "'" (inner | nested_doublequoted | nested_backquoted)* "'" -> singlequoted
+    nested_doublequoted: "\"" (inner | nested_singlequoted | nested_backquoted)* "\"" -> doublequoted
+    nested_backquoted: "`" (inner | nested_singlequoted | nested_doublequoted)* "`" -> backquoted
+
+    inner: /[^'"`\n<>]+/
+
+    io_redirection: input_redirection | output_redirection | append_redirection | heredoc_redirection
+    input_redirection: "<" _WS? filename
+    output_redirection: ">" _WS? filename
+    append_redirection: ">>" _WS? filename
+    heredoc_redirection: "<<" _WS? filename
+
+    filename: /[\w\.\-\/]+/
+
+    AMP: "&"
+
+    _WS.2: /[ \t]+/
+
+    %import common.NEWLINE
+    %ignore NEWLINE
+"""
+
+# LALR counterparts of the Earley grammars
+LALR_VARIANTS = {LARK_GRAMMAR: LALR_GRAMMAR}
+
+# Parsing mode, "lalr" tries the LALR grammar first and falls back to Earley
+PARSER_MODE = os.environ.get("COMP0010_PARSER", "lalr")
+
+
+# Serialized grammar analysis stored with the package, see tools/build_parser
+GRAMMAR_CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "shellGrammar.cache")
+
+# Serialized LALR parser, written and validated by Lark itself
+LALR_CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "shellLalrParser.cache")
+
+
+# Identify a grammar together with the library versions its serialization depends on
+def grammar_hash(grammar):
+    key = grammar + lark.__version__ + str(sys.version_info[:2])
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+# Analyse the grammar text and store the result for later processes
+def build_grammar_cache(grammar, path=GRAMMAR_CACHE_FILE):
+    analysed, _ = load_grammar(grammar, "<string>", None, False)
+    try:
+        with open(path, "wb") as f:
+            pickle.dump({"hash": grammar_hash(grammar), "grammar": analysed}, f, pickle.HIGHEST_PROTOCOL)
+    except OSError:
+        # Read-only installation, keep using the in-memory result
+        pass
+    return analysed
+
+
+# Load the stored grammar, regenerating it when the grammar text has changed
+def load_grammar_cache(grammar, path=GRAMMAR_CACHE_FILE):
+    try:
+        with open(path, "rb") as f:
+            cached = pickle.load(f)
+        if cached["hash"] == grammar_hash(grammar):
+            return cached["grammar"]
+    except Exception:
+        # Missing or unreadable cache file, fall through and rebuild it
+        pass
+    return build_grammar_cache(grammar, path)
+
+
+# Analysed grammars loaded at import time, keyed by grammar text
+LOADED_GRAMMARS = {LARK_GRAMMAR: load_grammar_cache(LARK_GRAMMAR)}
+
+# Process-wide cache of compiled parsers, keyed by grammar text and options
+PARSER_CACHE = {}
+
+
+# Build a parser for the grammar once and reuse it for every later call
+def get_parser(grammar, **options):
+    options.setdefault("start", "command")
+    options.setdefault("parser", "earley")
+    key = (grammar, tuple(sorted(options.items())))
+    parser = PARSER_CACHE.get(key)
+    if parser is None:
+        parser = Lark(LOADED_GRAMMARS.get(grammar, grammar), **options)
+        PARSER_CACHE[key] = parser
+    return parser
+
+
+# The LALR parser for a grammar, or None if it only has an Earley form
+def lalr_parser(grammar):
+    lalr_grammar = LALR_VARIANTS.get(grammar)
+    if lalr_grammar is None:
+        return None
+    return get_parser(lalr_grammar, parser="lalr", lexer="contextual", cache=LALR_CACHE_FILE)
+
+
+# Parse with LALR when selected, falling back to Earley for lines it rejects
+def parse_tree(grammar, cmdline, mode=None):
+    if (mode or PARSER_MODE) == "lalr":
+        parser = lalr_parser(grammar)
+        if parser is not None:
+            try:
+                return parser.parse(cmdline)
+            except UnexpectedInput:
+                pass
+    return get_parser(grammar).parse(cmdline)
+
+
+def larkParser(grammar, cmdline, mode=None):
     try:
-        parser = Lark(grammar, start="command", parser="earley")
         # Parse the command line
-        parsed = parser.parse(cmdline)
-        # Transform the parse tree
-        transformed = ShellCommandTransformer().transform(parsed)
+        parsed = parse_tree(grammar, cmdline, mode)
     except Exception as e:
         raise ValueError(f"Error using lark parser: {e}")
-    return transformed["command"][0]
+    try:
+        # Transform the parse tree into the command line AST
+        return ShellCommandTransformer().transform(parsed)
+    except VisitError as e:
+        # Report errors found while building the AST as they were raised
+        raise ValueError(str(e.orig_exc))
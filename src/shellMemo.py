@@ -0,0 +1,157 @@
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict, deque
+from itertools import chain
+from shellDecorator import pureCommands
+from shellFileProcessing import Chunks
+
+# Output of pure commands is reused while the files they read stay the same.
+# COMP0010_MEMO=0 turns it off
+MEMO_ENABLED = os.environ.get("COMP0010_MEMO", "1") != "0"
+
+# Number of cached outputs, and the most characters of piped input hashed and of
+# output kept for one of them. Larger runs are streamed without caching
+MEMO_SIZE = 128
+MEMO_INPUT_SIZE = 1 << 18
+MEMO_ENTRY_SIZE = 1 << 20
+
+# File times come from a coarse clock, so a file changed this many seconds before
+# it was read could change again without its fingerprint changing. Runs reading
+# such files are not cached
+MEMO_SETTLE = 2.0
+
+
+# Inode, modification time and size of a path, None when it does not exist
+def fingerprint(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+# Files and directories a command read, with their fingerprints when it read them.
+# Input that cannot be checked later, such as the terminal, makes the run untracked
+class Reads:
+    def __init__(self):
+        self.files = []
+        self.tracked = True
+
+    def add(self, path, file=None):
+        if path is None:
+            self.tracked = False
+            return
+        if file is None:
+            saved = fingerprint(path)
+        else:
+            # An open file is fingerprinted through its handle, the one that was read
+            try:
+                stat = os.fstat(file.fileno())
+            except (OSError, TypeError, ValueError):
+                self.tracked = False
+                return
+            saved = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if saved is not None and time.time_ns() - saved[1] < MEMO_SETTLE * 1e9:
+            self.tracked = False
+        self.files.append((path, saved))
+
+
+# Piped input is read ahead up to MEMO_INPUT_SIZE characters to hash it. Returns
+# the digest, None when the input is too large, and the input to run with. Lists
+# from callers are already read and passed on as they are
+def digest_input(contents, limit=MEMO_INPUT_SIZE):
+    if contents is None:
+        return "", None
+    if not isinstance(contents, Chunks):
+        lines = "".join(contents)
+        if len(lines) > limit:
+            return None, contents
+        return hashlib.blake2b(lines.encode(errors="surrogatepass")).hexdigest(), contents
+    chunks = iter(contents.chunks)
+    digest, taken, size = hashlib.blake2b(), [], 0
+    for chunk in chunks:
+        taken.append(chunk)
+        size += sum(map(len, chunk))
+        if size > limit:
+            return None, Chunks(chain(taken, chunks))
+        digest.update("".join(chunk).encode(errors="surrogatepass"))
+    return digest.hexdigest(), Chunks(iter(taken))
+
+
+# Bounded LRU cache of the output chunks of pure commands, keyed on the command,
+# its arguments, the working directory, input redirection and a hash of piped
+# input. An entry is only used while every file it read still has its fingerprint
+class MemoCache:
+    def __init__(self, maxsize=MEMO_SIZE, enabled=MEMO_ENABLED):
+        self.maxsize = maxsize
+        self.enabled = enabled
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def memoizes(self, commandname):
+        return self.enabled and commandname in pureCommands
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                files, chunks = entry
+                if all(fingerprint(path) == saved for path, saved in files):
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return chunks
+                del self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, files, chunks):
+        with self.lock:
+            self.entries[key] = (tuple(files), chunks)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self.entries), "maxsize": self.maxsize}
+
+    # Output chunks of a pure command, from the cache or from running it. A run is
+    # only cached once it has produced all its output
+    def chunks(self, commandname, cmd_class, args, extra_dict):
+        digest, contents = digest_input(extra_dict.get("contents"))
+        key = None
+        if digest is not None:
+            key = (commandname, tuple(args), os.getcwd(), extra_dict.get("inputFile"), digest)
+            cached = self.get(key)
+            if cached is not None:
+                for chunk in cached:
+                    yield list(chunk)
+                return
+
+        reads = Reads()
+        extra_dict = dict(extra_dict, contents=contents, reads=reads)
+        output, size = [], 0
+        for chunk in cmd_class(args, deque(), extra_dict).chunks():
+            if output is not None:
+                size += sum(map(len, chunk))
+                if size > MEMO_ENTRY_SIZE:
+                    output = None
+                else:
+                    output.append(tuple(chunk))
+            yield chunk
+        if key is not None and output is not None and reads.tracked:
+            self.put(key, reads.files, tuple(output))
+
+
+# Shared by every command line of the session
+MEMO_CACHE = MemoCache()
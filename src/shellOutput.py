@@ -0,0 +1,108 @@
+import io
+import os
+import shutil
+import secrets
+
+# Characters an output sink holds before writing them out, and when it writes:
+# "size" once the buffer is full, "line" after every line. Whatever is left is
+# written when the command line ends
+BUFFER_SIZE = int(os.environ.get("COMP0010_OUTPUT_BUFFER", 1 << 16))
+FLUSH_POLICY = os.environ.get("COMP0010_FLUSH", "size")
+FLUSH_POLICIES = ("size", "line")
+
+# COMP0010_ATOMIC_REDIRECT=1 writes redirected output to a temporary file that only
+# replaces the target once the command succeeds
+ATOMIC_REDIRECT = os.environ.get("COMP0010_ATOMIC_REDIRECT") == "1"
+
+
+# Output of commands written out while it is produced instead of kept until the end.
+# Commands append and extend it like the deque they fill otherwise, and write is
+# called with the buffered text joined into one string
+class OutputSink:
+    def __init__(self, write, buffer_size=BUFFER_SIZE, flush_policy=FLUSH_POLICY):
+        if flush_policy not in FLUSH_POLICIES:
+            raise ValueError(f"Unknown flush policy: {flush_policy}")
+        self.write = write
+        self.buffer_size = buffer_size
+        self.flush_policy = flush_policy
+        self.buffer = []
+        self.size = 0
+
+    def append(self, line):
+        self.buffer.append(line)
+        self.size += len(line)
+        self.written()
+
+    def extend(self, lines):
+        if not isinstance(lines, list):
+            lines = list(lines)
+        self.buffer.extend(lines)
+        self.size += sum(map(len, lines))
+        self.written()
+
+    def written(self):
+        if self.flush_policy == "line" or self.size >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            text = "".join(self.buffer)
+            self.buffer.clear()
+            self.size = 0
+            self.write(text)
+
+
+# Sink of a redirected command writing into its target file while the command runs.
+# In atomic mode it writes to a temporary file in the same directory, starting from
+# a copy of the target when appending, and close replaces the target with it
+class FileSink(OutputSink):
+    def __init__(self, path, append=False, atomic=None):
+        self.path = path
+        self.temp = None
+        if ATOMIC_REDIRECT if atomic is None else atomic:
+            self.file = self.open_temp(append)
+        else:
+            self.file = open(path, "a" if append else "w")
+        super().__init__(self.file.write, BUFFER_SIZE, "size")
+
+    # The temporary file is created with the mode a new target would get, the process
+    # umask applied by the system, and takes the mode of an existing target
+    def open_temp(self, append):
+        directory, name = os.path.split(self.path)
+        while True:
+            self.temp = os.path.join(directory or ".", f".{name}.{secrets.token_hex(4)}.tmp")
+            try:
+                fd = os.open(self.temp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+                break
+            except FileExistsError:
+                continue
+        # The target is copied as bytes, whatever its line endings and encoding
+        binary = os.fdopen(fd, "wb")
+        try:
+            if os.path.exists(self.path):
+                shutil.copymode(self.path, self.temp)
+                if append:
+                    with open(self.path, "rb") as target:
+                        shutil.copyfileobj(target, binary)
+            return io.TextIOWrapper(binary)
+        except Exception:
+            binary.close()
+            os.remove(self.temp)
+            raise
+
+    # Without atomic mode the output of a failed command stays in the file, as the
+    # command wrote it
+    def close(self, success=True):
+        try:
+            self.flush()
+            self.file.close()
+        except Exception:
+            self.file.close()
+            success = False
+            raise
+        finally:
+            if self.temp is not None:
+                if success:
+                    os.replace(self.temp, self.path)
+                else:
+                    os.remove(self.temp)
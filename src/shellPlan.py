@@ -0,0 +1,341 @@
+import os
+import threading
+from queue import Queue, Empty, Full
+from collections import deque
+from shellAst import Seq, Pipe, Call, Background
+from shellCommandFactory import CommandFactory
+from shellFileProcessing import Chunks
+from shellWorkerPool import WORKER_POOL
+from shellJobs import JOBS, describe
+import shellProfile
+from shellProfile import StageRecord
+
+
+# Every generator in a chain of pipeline stages adds frames to the stack, so very
+# long pipelines collect the lines between groups of this many stages
+STREAM_DEPTH = 64
+
+# COMP0010_PIPELINE=threads runs every stage but the last on its own thread, and
+# COMP0010_PIPELINE=processes hands the CPU-bound work of stages to worker processes
+PIPELINE_MODE = os.environ.get("COMP0010_PIPELINE", "stream")
+
+# Threaded stages merge their chunks into batches of at least BATCH_SIZE lines, with at
+# most QUEUE_BATCHES batches waiting between two stages. Longer pipelines than
+# MAX_THREAD_STAGES stream
+BATCH_SIZE = 256
+QUEUE_BATCHES = 16
+MAX_THREAD_STAGES = 64
+
+# Seconds a finished pipeline waits for each cancelled stage to end. A stage blocked
+# reading the terminal cannot see that it was cancelled, and is left to end with its
+# input as its thread is a daemon
+STAGE_CLOSE_TIMEOUT = 1.0
+
+
+# Compiled form of a parsed command line with command classes, arguments and
+# redirections resolved up front. Plans are immutable and keep all per-run
+# state in locals, so one plan can be run repeatedly and from several threads
+class Plan:
+    __slots__ = ("node",)
+    commandtype = None
+
+    def __init__(self, node, **fields):
+        object.__setattr__(self, "node", node)
+        for name, value in fields.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.node!r})"
+
+    # Errors are chained with the type of every command they pass through. A pipeline
+    # passes the record of its last stage when it is profiled
+    def run(self, out, contents=None, pool=None, record=None):
+        try:
+            if shellProfile.PROFILER is None:
+                self.execute(out, contents, pool)
+            else:
+                self.profile(shellProfile.PROFILER, out, contents, pool, record)
+        except Exception as e:
+            raise ValueError(f"Error executing {self.commandtype} command: {e}")
+
+    def execute(self, out, contents=None, pool=None):
+        raise NotImplementedError("Must be implemented by subclasses")
+
+    # Plans without stages of their own leave profiling to the plans they run
+    def profile(self, profiler, out, contents, pool, record):
+        self.execute(out, contents, pool)
+
+
+# Sequence plan, every command writes straight into the output of the command line
+class SeqPlan(Plan):
+    __slots__ = ("commands",)
+    commandtype = "sequence"
+
+    def __init__(self, node):
+        super().__init__(node, commands=tuple(compilePlan(command) for command in node.commands))
+
+    def execute(self, out, contents=None, pool=None):
+        for plan in self.commands:
+            plan.run(out)
+
+
+# One lazily evaluated pipeline stage. An error ends its output early and is kept,
+# so the stages after it are not blamed for it
+class PipeStage:
+    def __init__(self, plan, contents, pool=None, record=None):
+        self.chunks = plan.chunks(contents, pool)
+        if record is not None:
+            self.chunks = shellProfile.PROFILER.chunks(record, self.chunks)
+        self.error = None
+
+    def __iter__(self):
+        try:
+            yield from self.chunks
+        except Exception as e:
+            self.error = e
+
+    # Stop the stage where it is, closing the files it was reading
+    def close(self):
+        self.chunks.close()
+
+
+# Marks the end of a threaded stage's output, with the error that ended it if any
+class StageEnd:
+    __slots__ = ("error",)
+
+    def __init__(self, error=None):
+        self.error = error
+
+
+# A pipeline stage running on its own thread. Its lines go to the next stage in
+# batches through a bounded queue, so a fast stage waits for a slow one instead of
+# buffering its output. An error travels behind the lines produced before it, and
+# only counts once the next stage has read that far, as with PipeStage
+class ThreadStage:
+    # The stages of a pipeline share one event, so a stage that reads without
+    # putting anything, like grep with no match, stops when the pipeline is done
+    def __init__(self, plan, contents, cancelled, record=None):
+        self.chunks = plan.chunks(contents)
+        if record is not None:
+            self.chunks = shellProfile.PROFILER.chunks(record, self.chunks)
+        self.error = None
+        self.queue = Queue(maxsize=QUEUE_BATCHES)
+        self.cancelled = cancelled
+        self.job = JOBS.current_job()
+        self.thread = threading.Thread(target=self.work, daemon=True)
+        self.thread.start()
+
+    # Returns False once the stage is cancelled
+    def put(self, item):
+        while not self.cancelled.is_set():
+            try:
+                self.queue.put(item, timeout=0.05)
+                return True
+            except Full:
+                pass
+        return False
+
+    def work(self):
+        JOBS.current.job = self.job
+        end, batch = StageEnd(), []
+        try:
+            for chunk in self.chunks:
+                batch.extend(chunk)
+                if len(batch) >= BATCH_SIZE:
+                    if not self.put(batch):
+                        return
+                    batch = []
+        except Exception as e:
+            end.error = e
+        finally:
+            # The generator is closed on the thread that ran it
+            self.chunks.close()
+        if not batch or self.put(batch):
+            self.put(end)
+
+    def __iter__(self):
+        while not self.cancelled.is_set():
+            try:
+                item = self.queue.get(timeout=0.05)
+            except Empty:
+                continue
+            if isinstance(item, StageEnd):
+                self.error = item.error
+                return
+            yield item
+
+    def close(self):
+        self.cancelled.set()
+        self.thread.join(STAGE_CLOSE_TIMEOUT)
+
+
+# Pipe plan, stages are chained as generators so chunks of lines flow through the
+# pipeline, and the last stage writes its output as it is produced
+class PipePlan(Plan):
+    __slots__ = ("commands",)
+    commandtype = "pipeline"
+
+    def __init__(self, node):
+        super().__init__(node, commands=tuple(compilePlan(command) for command in node.commands))
+
+    def threaded(self):
+        return PIPELINE_MODE == "threads" and len(self.commands) <= MAX_THREAD_STAGES
+
+    # Records are given when the pipeline is profiled, one for every stage
+    def execute(self, out, contents=None, pool=None, records=None):
+        threaded = self.threaded()
+        if PIPELINE_MODE == "processes":
+            pool = WORKER_POOL
+        records = records or (None,) * len(self.commands)
+        cancelled = threading.Event()
+        stages = []
+        for i, plan in enumerate(self.commands[:-1]):
+            if not threaded and i and i % STREAM_DEPTH == 0:
+                contents = Chunks(list(contents.chunks))
+            if threaded:
+                stage = ThreadStage(plan, contents, cancelled, records[i])
+            else:
+                stage = PipeStage(plan, contents, pool, records[i])
+            stages.append(stage)
+            contents = Chunks(iter(stage))
+
+        try:
+            self.commands[-1].run(out, contents, pool, records[-1])
+            error = None
+        except Exception as e:
+            error = e
+
+        # Once the last stage is done no more input is needed, so earlier stages are
+        # cancelled instead of run to the end. The first stage that failed on the
+        # lines that were read is reported after the output that got through, as
+        # if the stages had run in turn
+        for stage in reversed(stages):
+            stage.close()
+        for stage in stages:
+            if stage.error is not None:
+                raise stage.error
+        if error is not None:
+            raise error
+
+    # One record for the pipeline and one for each stage, reported together
+    def profile(self, profiler, out, contents, pool, record):
+        total = StageRecord("pipeline", describe(self.node))
+        records = [StageRecord("call", describe(plan.node), i + 1) for i, plan in enumerate(self.commands)]
+        try:
+            profiler.measure(total, self.execute, profiler.counting(out, total), contents, pool, records)
+        finally:
+            profiler.pipeline(total, records, nested=not self.threaded())
+
+
+# Call plan, redirection errors are kept and raised when the call runs so that
+# earlier commands of a sequence still execute
+class CallPlan(Plan):
+    __slots__ = ("resolved", "redirection", "error", "substitution")
+    commandtype = "call"
+
+    def __init__(self, node):
+        try:
+            redirection, error = CallPlan.handle_io_redirection(node.redirects), None
+        except ValueError as e:
+            redirection, error = (None, None), str(e)
+
+        # A substituted command line is only known at run time
+        substitution, resolved = node.substitution, None
+        if substitution is not None:
+            substitution = (substitution.before, compilePlan(substitution.command), substitution.after)
+        else:
+            resolved = CommandFactory.resolve(node.command)
+        super().__init__(node, resolved=resolved, redirection=redirection,
+                         error=error, substitution=substitution)
+
+    @staticmethod
+    def handle_io_redirection(redirects):
+        input_redirection, output_redirection = None, None
+        for redirect in redirects:
+            if redirect.direction == 'input':
+                if input_redirection:
+                    raise ValueError('Multiple input redirections')
+                input_redirection = (redirect.target, redirect.extended)
+            elif redirect.direction == 'output':
+                if output_redirection:
+                    raise ValueError('Multiple output redirections')
+                output_redirection = (redirect.target, redirect.extended)
+        return input_redirection, output_redirection
+
+    # Run the substituted command and capture its output as a single line
+    def substitute(self):
+        before, plan, after = self.substitution
+        captured = deque()
+        plan.run(captured)
+        return before + ''.join(captured).rstrip("\n").replace("\n", " ") + after
+
+    def factory(self, out, contents, pool=None):
+        if self.error is not None:
+            raise ValueError(self.error)
+        in_redir, out_redir = self.redirection
+        extra_dict = {
+            "inputFile": in_redir,
+            "outputFile": out_redir,
+            "contents": contents,
+            "pool": pool
+        }
+        if self.substitution is not None:
+            return CommandFactory(self.substitute(), out, extra_dict), None
+        return CommandFactory(self.node.command, out, extra_dict), self.resolved
+
+    def execute(self, out, contents=None, pool=None):
+        factory, resolved = self.factory(out, contents, pool)
+        factory.execute(resolved)
+
+    # A call on its own is reported right away, the last stage of a pipeline with it
+    def profile(self, profiler, out, contents, pool, record):
+        if record is not None:
+            profiler.measure(record, self.execute, profiler.counting(out, record), contents, pool)
+            return
+        record = StageRecord("call", describe(self.node))
+        try:
+            profiler.measure(record, self.execute, profiler.counting(out, record), contents, pool)
+        finally:
+            profiler.report([record])
+
+    # Output chunks of the call as they are produced, for a stage feeding a pipe
+    def chunks(self, contents=None, pool=None):
+        try:
+            factory, resolved = self.factory(deque(), contents, pool)
+            yield from factory.chunks(resolved)
+        except Exception as e:
+            raise ValueError(f"Error executing {self.commandtype} command: {e}")
+
+
+# Background plan, the command is handed to the job table and the line goes on
+class BackgroundPlan(Plan):
+    __slots__ = ("command", "text")
+    commandtype = "background"
+
+    def __init__(self, node):
+        super().__init__(node, command=compilePlan(node.command), text=describe(node.command))
+
+    def execute(self, out, contents=None, pool=None):
+        JOBS.submit(self.command, self.text)
+
+
+PLANS = {
+    Seq: SeqPlan,
+    Pipe: PipePlan,
+    Call: CallPlan,
+    Background: BackgroundPlan,
+}
+
+
+# Compile an AST node into its plan
+def compilePlan(node):
+    plan = PLANS.get(type(node))
+    if plan is None:
+        raise ValueError("Invalid command line")
+    return plan(node)
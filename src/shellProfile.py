@@ -0,0 +1,196 @@
+import sys
+import json
+import time
+import threading
+import tracemalloc
+
+# Set by enable, plans look at it once per command they run and pay nothing else
+# while it is None
+PROFILER = None
+
+
+# Measurements of a call, a pipeline stage or a whole pipeline. Times add up over
+# every stretch the stage was running, and peak is the highest traced memory seen
+# while it was
+class StageRecord:
+    def __init__(self, kind, command, stage=None):
+        self.kind = kind
+        self.command = command
+        self.stage = stage
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.lines_in = 0
+        self.bytes_in = 0
+        self.lines_out = 0
+        self.bytes_out = 0
+        self.base = tracemalloc.get_traced_memory()[0]
+        self.peak = self.base
+        self.started = None
+        self.error = None
+
+    def count(self, lines):
+        self.lines_out += len(lines)
+        self.bytes_out += sum(len(line.encode()) for line in lines)
+
+    def result(self):
+        return {
+            "kind": self.kind,
+            "stage": self.stage,
+            "command": self.command,
+            "wall_ms": round(self.wall * 1e3, 3),
+            "cpu_ms": round(self.cpu * 1e3, 3),
+            "lines_in": self.lines_in,
+            "bytes_in": self.bytes_in,
+            "lines_out": self.lines_out,
+            "bytes_out": self.bytes_out,
+            "peak_kib": round((self.peak - self.base) / 1024, 1),
+            "error": self.error,
+        }
+
+
+# Output of a profiled command, counted on its way to the real output
+class CountingOut:
+    def __init__(self, out, record):
+        self.out = out
+        self.record = record
+
+    def append(self, line):
+        self.record.count([line])
+        self.out.append(line)
+
+    def extend(self, lines):
+        if not isinstance(lines, list):
+            lines = list(lines)
+        self.record.count(lines)
+        self.out.extend(lines)
+
+
+class Profiler:
+    def __init__(self, path=None):
+        self.path = path
+        self.lock = threading.Lock()
+        # Records whose stage is running, innermost last, on every thread
+        self.local = threading.local()
+        # Traced peak at the last update
+        self.seen_peak = tracemalloc.get_traced_memory()[1]
+
+    def running(self):
+        if not hasattr(self.local, "records"):
+            self.local.records = []
+        return self.local.records
+
+    # Give the memory peak since the last update to every running record. Python 3.8
+    # cannot reset the traced peak, so it only rises: if it rose since the last update
+    # the new peak was reached meanwhile, otherwise the memory in use now is the best
+    # known value
+    def update_peak(self):
+        with self.lock:
+            current, peak = tracemalloc.get_traced_memory()
+            reached = peak if peak > self.seen_peak else current
+            self.seen_peak = peak
+        for record in self.running():
+            record.peak = max(record.peak, reached)
+
+    def enter(self, record):
+        self.update_peak()
+        self.running().append(record)
+        record.started = (time.perf_counter(), time.thread_time())
+
+    def leave(self, record):
+        self.update_peak()
+        self.running().pop()
+        wall, cpu = record.started
+        record.wall += time.perf_counter() - wall
+        record.cpu += time.thread_time() - cpu
+
+    def measure(self, record, function, *args):
+        self.enter(record)
+        try:
+            function(*args)
+        except Exception as e:
+            record.error = str(e)
+            raise
+        finally:
+            self.leave(record)
+
+    # Pass on the chunks of a pipeline stage, timing the stage while it makes them
+    def chunks(self, record, chunks):
+        try:
+            while True:
+                self.enter(record)
+                try:
+                    chunk = next(chunks, None)
+                    if chunk is not None:
+                        record.count(chunk)
+                except Exception as e:
+                    record.error = str(e)
+                    raise
+                finally:
+                    self.leave(record)
+                if chunk is None:
+                    return
+                yield chunk
+        finally:
+            chunks.close()
+
+    def counting(self, out, record):
+        return CountingOut(out, record)
+
+    # Stages that run one inside another on a single thread include the time of
+    # the stages they pull from, which is taken off to leave their own. Stages on
+    # threads of their own are not running records of the pipeline's thread, so
+    # the pipeline takes their peaks here
+    def pipeline(self, total, records, nested):
+        for previous, record in zip(records, records[1:]):
+            record.lines_in = previous.lines_out
+            record.bytes_in = previous.bytes_out
+        for record in records:
+            total.peak = max(total.peak, total.base + record.peak - record.base)
+        if nested:
+            for previous, record in reversed(list(zip(records, records[1:]))):
+                record.wall -= previous.wall
+                record.cpu -= previous.cpu
+        self.report([total] + records)
+
+    def report(self, records):
+        self.write([record.result() for record in records])
+
+    # Counters of a session cache, reported once when the shell exits
+    def report_cache(self, name, info):
+        self.write([{"kind": "cache", "command": name, **info}])
+
+    def write(self, results):
+        with self.lock:
+            if self.path is None:
+                for result in results:
+                    print(self.format(result), file=sys.stderr)
+            else:
+                with open(self.path, "a") as f:
+                    for result in results:
+                        f.write(json.dumps(result) + "\n")
+
+    @staticmethod
+    def format(result):
+        if result["kind"] == "cache":
+            return (f"profile: {result['command']} cache: hits {result['hits']}, misses {result['misses']}, "
+                    f"entries {result['size']}/{result['maxsize']}")
+        name = f"  [{result['stage']}] {result['command']}" if result["stage"] else result["command"]
+        text = (f"profile: {name}: wall {result['wall_ms']:.3f} ms, cpu {result['cpu_ms']:.3f} ms, "
+                f"in {result['lines_in']} lines/{result['bytes_in']} B, "
+                f"out {result['lines_out']} lines/{result['bytes_out']} B, peak {result['peak_kib']:.1f} KiB")
+        return text + (" (failed)" if result["error"] else "")
+
+
+# Turn profiling on for the rest of the process, reporting to stderr or appending
+# JSON lines to path
+def enable(path=None):
+    global PROFILER
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    PROFILER = Profiler(path)
+
+
+def disable():
+    global PROFILER
+    PROFILER = None
+    tracemalloc.stop()
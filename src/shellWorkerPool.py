@@ -0,0 +1,80 @@
+import os
+import threading
+from collections import deque
+from itertools import islice, chain
+from concurrent.futures import ProcessPoolExecutor
+
+# Lines sent to a worker process at a time, and the number of worker processes
+CHUNK_LINES = int(os.environ.get("COMP0010_CHUNK_LINES", 16384))
+WORKERS = int(os.environ.get("COMP0010_WORKERS", os.cpu_count() or 1))
+
+
+# Process pool for CPU-bound commands. The processes are started on first use and
+# shared by every later command line of the session
+class WorkerPool:
+    def __init__(self, workers=WORKERS, chunk_lines=CHUNK_LINES):
+        self.workers = workers
+        self.chunk_lines = chunk_lines
+        self.pool = None
+        # Submitted work not yet done, cancelled on shutdown
+        self.pending = set()
+        # Background jobs can start the pool from several threads at once
+        self.lock = threading.Lock()
+
+    def executor(self):
+        with self.lock:
+            if self.pool is None:
+                self.pool = ProcessPoolExecutor(max_workers=self.workers)
+            return self.pool
+
+    def chunks(self, lines):
+        lines = iter(lines)
+        while True:
+            chunk = list(islice(lines, self.chunk_lines))
+            if not chunk:
+                return
+            yield chunk
+
+    # Apply function(*args, chunk) to the lines chunk by chunk, yielding the results
+    # in input order. An input that fits in one chunk is handled in this process,
+    # and at most two chunks per worker are waiting at a time
+    def map(self, function, args, lines):
+        chunks = self.chunks(lines)
+        first = next(chunks, None)
+        if first is None:
+            return
+        if len(first) < self.chunk_lines:
+            yield function(*args, first)
+            return
+
+        pending = deque()
+        try:
+            for chunk in chain((first,), chunks):
+                pending.append(self.submit(function, *args, chunk))
+                if len(pending) >= 2 * self.workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            # Work nobody is waiting for any more, after head for example
+            for future in pending:
+                future.cancel()
+
+    def submit(self, function, *args):
+        future = self.executor().submit(function, *args)
+        self.pending.add(future)
+        future.add_done_callback(self.pending.discard)
+        return future
+
+    # Executor.shutdown only cancels waiting work itself from Python 3.9
+    def shutdown(self):
+        with self.lock:
+            pool, self.pool = self.pool, None
+        if pool is not None:
+            for future in list(self.pending):
+                future.cancel()
+            pool.shutdown(wait=True)
+
+
+# Shared by every pipeline of the session in COMP0010_PIPELINE=processes mode
+WORKER_POOL = WorkerPool()
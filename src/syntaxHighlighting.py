@@ -13,9 +13,9 @@ class Comp0010ShellLexer(RegexLexer):
             (r'\s+', Text),
 
             # Commands
-            (r'\b(cd|pwd|ls|cat|echo|head|tail|grep|find|sort|uniq|cut|\
+            (r'\b(cd|pwd|ls|cat|echo|head|tail|grep|find|sort|uniq|cut|wait|jobs|filecache|memocache|\
                 --help|_cd|_pwd|_ls|_cat|_echo|_head|_tail|_grep|_find|\
-                _sort|_uniq|_cut)\b', Keyword),
+                _sort|_uniq|_cut|_wait|_jobs|_filecache|_memocache)\b', Keyword),
 
             # Operators
             (r'[;|<>]', Operator),
@@ -6,8 +6,10 @@ from io import StringIO
 from unittest.mock import patch
 import sys
 sys.path.append('./src')
-from shellCommands import HelpCommand, PwdCommand, LsCommand, CdCommand, CatCommand, EchoCommand, HeadCommand, TailCommand, GrepCommand, UniqCommand, CutCommand, FindCommand, SortCommand, UnsafeCdCommand, UnsafeLsCommand, UnsafePwdCommand, UnsafeCatCommand, UnsafeEchoCommand, UnsafeHeadCommand, UnsafeTailCommand, UnsafeGrepCommand, UnsafeCutCommand, UnsafeFindCommand, UnsafeSortCommand, UnsafeUniqCommand
+from shellCommands import HelpCommand, PwdCommand, LsCommand, CdCommand, CatCommand, EchoCommand, HeadCommand, TailCommand, GrepCommand, UniqCommand, CutCommand, FindCommand, SortCommand, UnsafeCdCommand, UnsafeLsCommand, UnsafePwdCommand, UnsafeCatCommand, UnsafeEchoCommand, UnsafeHeadCommand, UnsafeTailCommand, UnsafeGrepCommand, UnsafeCutCommand, UnsafeFindCommand, UnsafeSortCommand, UnsafeUniqCommand, FileCacheCommand, MemoCacheCommand
 from shellExceptions import ErrorExectuingApplication, InvalidCommandlineArgument
+from shellFileProcessing import Chunks, FileCache
+from shellMemo import MemoCache
 
 class TestPwd(unittest.TestCase):
     def test_pwd(self):
@@ -42,12 +44,19 @@ class TestHelp(unittest.TestCase):
         cat [FILE]...: Concatenates and displays FILE(s), or stdin if no file is given
         echo [ARG]...: Prints arguments to stdout
         head -n [NUM] [FILE]: Displays first NUM lines of FILE, default is 10 lines
+        head -c [NUM] [FILE]: Displays first NUM bytes of FILE
         tail -n [NUM] [FILE]: Displays last NUM lines of FILE, default is 10 lines
+        tail -c [NUM] [FILE]: Displays last NUM bytes of FILE
         grep [PATTERN] [FILE]...: Searches for PATTERN in FILE(s) or stdin
         find [PATH] -name [PATTERN]: Searches PATH for files matching PATTERN
         sort [-r] [FILE]: Sorts FILE or stdin, -r for reverse order
         uniq [-i] [FILE]: Filters consecutive duplicate lines in FILE or stdin, -i for ignoring case
         cut -b [RANGES] [FILE]: Cuts out specified byte RANGES (numbers or ranges connected by '-') from FILE or stdin
+        [COMMAND] &: Runs COMMAND as a background job while the rest of the line goes on
+        wait [JOB]...: Waits for JOB(s), or all jobs, and outputs their results in job order
+        jobs: Lists the background jobs that have not been waited for
+        filecache [-c | -s MIB]: Shows the cached files, clears them (-c) or sets the cache size (-s, 0 turns it off)
+        memocache [-c]: Shows the entries, hits and misses of the memoized output, or clears it (-c)
         Unsafe version: '_' + command name (e.g. _pwd)
         """
         out = deque()
@@ -386,6 +395,14 @@ class TestHead(unittest.TestCase):
         headClass.execute()
         self.assertEqual(list(out), [f"{i}\n" for i in range(1, 19)])
 
+    @patch('shellFileProcessing.READ_SIZE', 8)
+    def test_head_n_negative_streams(self):
+        extra_dict = {"inputFile": None, "outputFile": None, "contents": None}
+        headClass = HeadCommand(["-n", "-2", "numbers.txt"], deque(), extra_dict)
+        chunks = list(headClass.chunks())
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(sum(chunks, []), [f"{i}\n" for i in range(1, 19)])
+
     def test_head_n5(self):
         out = deque()
         extra_dict = {"inputFile": None, "outputFile": None, "contents": None}
@@ -440,6 +457,37 @@ class TestHead(unittest.TestCase):
         headClass.execute()
         self.assertEqual(list(out), [f"{i}\n" for i in range(1, 21)])
 
+    def test_head_n_file_without_newline(self):
+        with open("no_newline.txt", "w") as f:
+            f.write("first\nlast")
+        for count, chunk_size in [(2, 1024), (3, 1024), (2, 1)]:
+            out = deque()
+            extra_dict = {"inputFile": None, "outputFile": None, "contents": None}
+            with patch('shellCommands.CHUNK_SIZE', chunk_size):
+                HeadCommand(["-n", str(count), "no_newline.txt"], out, extra_dict).execute()
+            self.assertEqual(list(out), ["first\n", "last\n"])
+
+    def test_head_c(self):
+        with open("bytes.txt", "w") as f:
+            f.write("déf\nabc")
+        for args, expected in [(["-c", "2", "bytes.txt"], ["d\n"]), (["-c", "3", "bytes.txt"], ["dé\n"]),
+                               (["-c", "5", "bytes.txt"], ["déf\n"]), (["-c", "50", "bytes.txt"], ["déf\n", "abc\n"]),
+                               (["-c", "0", "bytes.txt"], []), (["-c", "3", "numbers.txt"], ["1\n", "2\n"])]:
+            out = deque()
+            extra_dict = {"inputFile": None, "outputFile": None, "contents": None}
+            HeadCommand(args, out, extra_dict).execute()
+            self.assertEqual(list(out), expected)
+
+    def test_head_c_stops_reading_its_input(self):
+        def chunks():
+            yield ["abc\n", "déf\n"]
+            raise AssertionError("read past the bytes needed")
+
+        out = deque()
+        extra_dict = {"inputFile": None, "outputFile": None, "contents": Chunks(chunks())}
+        HeadCommand(["-c", "6"], out, extra_dict).execute()
+        self.assertEqual(list(out), ["abc\n", "d\n"])
+
 
 class TestTail(unittest.TestCase):
     @classmethod
@@ -532,6 +580,14 @@ class TestTail(unittest.TestCase):
         tailClass.execute()
         self.assertEqual(list(out), [f"{i}\n" for i in range(11, 21)])
 
+    @patch('shellFileProcessing.READ_SIZE', 8)
+    def test_tail_n_across_chunks(self):
+        out = deque()
+        extra_dict = {"inputFile": None, "outputFile": None, "contents": None}
+        tailClass = TailCommand(["-n", "3", "numbers.txt"], out, extra_dict)
+        tailClass.execute()
+        self.assertEqual(list(out), ["18\n", "19\n", "20\n"])
+
     def test_tail_n(self):
         out = deque()
         extra_dict = {"inputFile": None, "outputFile": None, "contents": None}
@@ -539,6 +595,44 @@ class TestTail(unittest.TestCase):
         tailClass.execute()
         self.assertEqual(list(out), [f"{i}\n" for i in range(17, 21)])
 
+    @patch('shellFileProcessing.READ_SIZE', 4)
+    def test_tail_reads_back_from_the_end(self):
+        with open("no_newline.txt", "w") as f:
+            f.write("first\n\nthird line\nlast")
+        for count, expected in [(1, ["last\n"]), (3, ["\n", "third line\n", "last\n"]), (0, [])]:
+            out = deque()
+            extra_dict = {"inputFile": None, "outputFile": None, "contents": None}
+            TailCommand(["-n", str(count), "no_newline.txt"], out, extra_dict).execute()
+            self.assertEqual(list(out), expected)
+            # Redirected input is read from the start and gives the same lines
+            out = deque()
+            extra_dict = {"inputFile": ("no_newline.txt", False), "outputFile": None, "contents": None}
+            TailCommand(["-n", str(count)], out, extra_dict).execute()
+            self.assertEqual(list(out), expected)
+
+    def test_tail_c(self):
+        with open("bytes.txt", "w") as f:
+            f.write("abc\ndéf")
+        for args, expected in [(["-c", "3", "bytes.txt"], ["éf\n"]), (["-c", "2", "bytes.txt"], ["f\n"]),
+                               (["-c", "5", "bytes.txt"], ["\n", "déf\n"]), (["-c", "50", "bytes.txt"], ["abc\n", "déf\n"]),
+                               (["-c", "0", "bytes.txt"], []), (["-c", "3", "numbers.txt"], ["20\n"])]:
+            out = deque()
+            extra_dict = {"inputFile": None, "outputFile": None, "contents": None}
+            TailCommand(args, out, extra_dict).execute()
+            self.assertEqual(list(out), expected)
+
+    def test_tail_c_piped(self):
+        out = deque()
+        extra_dict = {"inputFile": None, "outputFile": None, "contents": ["abc\n", "déf\n"]}
+        TailCommand(["-c", "4"], out, extra_dict).execute()
+        self.assertEqual(list(out), ["éf\n"])
+
+    def test_tail_c_string_number(self):
+        extra_dict = {"inputFile": None, "outputFile": None, "contents": None}
+        tailClass = TailCommand(["-c", "five", "numbers.txt"], deque(), extra_dict)
+        with self.assertRaises(InvalidCommandlineArgument):
+            tailClass.execute()
+
 
 class TestGrep(unittest.TestCase):
     @classmethod
@@ -634,6 +728,16 @@ class TestGrep(unittest.TestCase):
         grepClass.execute()
         self.assertEqual(list(out), ["test2.txt:BBB\n", "test3.txt:CCC\n"])
 
+    @patch('shellFileProcessing.MMAP_SIZE', 1)
+    def test_grep_literal_in_mapped_files(self):
+        with open("test4.txt", "w") as f:
+            f.write("ABB\nxAB")
+        out = deque()
+        extra_dict = {"inputFile": None, "outputFile": None, "contents": None}
+        grepClass = GrepCommand(["AB", "test1.txt", "test4.txt"], out, extra_dict)
+        grepClass.execute()
+        self.assertEqual(list(out), ["test1.txt:ABB\n", "test4.txt:ABB\n", "test4.txt:xAB\n"])
+
     def test_grep_with_no_arguments(self):
         out = deque()
         extra_dict = {"inputFile": None, "outputFile": None, "contents": None}
@@ -758,6 +862,55 @@ class TestCut(unittest.TestCase):
         self.assertEqual(f"{context.exception}", expected)
 
 
+class TestCacheCommands(unittest.TestCase):
+    def setUp(self):
+        self.cache = FileCache(maxbytes=1 << 20)
+        patcher = patch('shellCommands.FILE_CACHE', self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_command(self, command, args):
+        out = deque()
+        extra_dict = {"inputFile": None, "outputFile": None, "contents": None}
+        command(args, out, extra_dict).execute()
+        return list(out)
+
+    def run_filecache(self, args):
+        return self.run_command(FileCacheCommand, args)
+
+    def test_filecache_shows_entries(self):
+        self.cache.put("/a.txt", (1, 2, 5), (("a\n",),), 5)
+        self.assertEqual(self.run_filecache([]), [f"files: 1, size: 5/{1 << 20} bytes, hits: 0, misses: 0\n", "5 /a.txt\n"])
+
+    def test_filecache_clear_and_resize(self):
+        self.cache.put("/a.txt", (1, 2, 5), (("a\n",),), 5)
+        self.assertEqual(self.run_filecache(["-s", "2"]), [])
+        self.assertEqual(self.cache.maxbytes, 2 << 20)
+        self.assertEqual(self.run_filecache(["-c"]), [])
+        self.assertEqual(self.cache.list(), [])
+        self.run_filecache(["-s", "0"])
+        self.assertFalse(self.cache.enabled())
+
+    def test_memocache(self):
+        memo = MemoCache(maxsize=4)
+        memo.put(("sort", ()), (), (["a\n"],))
+        memo.get(("sort", ()))
+        memo.get(("uniq", ()))
+        with patch('shellCommands.MEMO_CACHE', memo):
+            self.assertEqual(self.run_command(MemoCacheCommand, []), ["entries: 1/4, hits: 1, misses: 1\n"])
+            self.assertEqual(self.run_command(MemoCacheCommand, ["-c"]), [])
+            self.assertEqual(memo.info(), {"hits": 0, "misses": 0, "size": 0, "maxsize": 4})
+            with self.assertRaises(InvalidCommandlineArgument) as context:
+                self.run_command(MemoCacheCommand, ["-s", "1"])
+        self.assertEqual(f"{context.exception}", "Invalid memocache arguments")
+
+    def test_filecache_invalid_args(self):
+        for args in [["-x"], ["-s", "many"], ["-c", "-s"]]:
+            with self.assertRaises(InvalidCommandlineArgument) as context:
+                self.run_filecache(args)
+            self.assertEqual(f"{context.exception}", "Invalid filecache arguments")
+
+
 class TestFind(unittest.TestCase):
     @classmethod
     def setFileUp(cls, cmdline):
@@ -0,0 +1,41 @@
+import unittest
+import sys
+sys.path.append('./src')
+from shellAst import Call, Pipe, Seq, Redirect, Substitution
+
+
+class TestShellAst(unittest.TestCase):
+
+    def test_nodes_use_slots(self):
+        call = Call("echo hello")
+        with self.assertRaises(AttributeError):
+            call.extra = 1
+        self.assertFalse(hasattr(call, "__dict__"))
+
+    def test_call_defaults(self):
+        call = Call("echo hello")
+        self.assertEqual(call.redirects, ())
+        self.assertIsNone(call.substitution)
+
+    def test_redirect_defaults(self):
+        redirect = Redirect("output", "out.txt")
+        self.assertFalse(redirect.extended)
+
+    def test_equality(self):
+        left = Pipe((Call("echo a", (Redirect("input", "in.txt"),)), Call("cat")))
+        right = Pipe((Call("echo a", (Redirect("input", "in.txt"),)), Call("cat")))
+        self.assertEqual(left, right)
+        self.assertNotEqual(left, Seq(left.commands))
+        self.assertNotEqual(Call("echo a"), Call("echo b"))
+
+    def test_substitution_equality(self):
+        sub = Substitution("echo", Call("echo foo"), "bar")
+        self.assertEqual(Call("echo `echo foo` bar", (), sub), Call("echo `echo foo` bar", (), sub))
+
+    def test_repr(self):
+        self.assertEqual(repr(Redirect("output", "o.txt", True)),
+                         "Redirect(direction='output', target='o.txt', extended=True)")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,6 +3,7 @@ from unittest.mock import patch, MagicMock
 import sys
 sys.path.append('./src')
 from shellCommandFactory import CommandFactory, commandRegistry
+from shellOutput import FileSink
 
 
 class TestCommandFactory(unittest.TestCase):
@@ -34,7 +35,9 @@ class TestCommandFactory(unittest.TestCase):
             self.factory.extra_dict["outputFile"] = ("test_output.txt", False)
             self.factory.output_redirection()
             mock_file.assert_called_with("test_output.txt", "w")
-            self.assertEqual(self.factory.out, [])
+            # The command writes into the file instead of the shared output
+            self.assertEqual(self.out, [])
+            self.assertIsInstance(self.factory.out, FileSink)
 
     def test_parse_command_valid(self):
         commandname, args = self.factory.parse_command()
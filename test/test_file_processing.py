@@ -4,8 +4,11 @@ from io import StringIO
 from unittest.mock import patch
 import sys
 import subprocess
+import tempfile
+import time
+from itertools import chain
 sys.path.append('./src')
-from shellFileProcessing import FileProcessingCommand
+from shellFileProcessing import FileProcessingCommand, Chunks, FileCache, find_last_lines, chunk_size
 
 
 class TestFileProcessingCommand(unittest.TestCase):
@@ -50,11 +53,6 @@ class TestFileProcessingCommand(unittest.TestCase):
             print("error: failed to remove test_dir directory")
             exit(1)
 
-    def test_get_contents_from_file(self):
-        filename = 'test_file.txt'
-        expected = ['Line 1\n', 'Line 2\n', 'Line 3\n']
-        self.assertEqual(self.command.get_contents(filename), expected)
-
     def test_handle_exceptions(self):
         with self.assertRaises(ValueError):
             self.command.handle_exceptions(lambda: 1 / 0)
@@ -143,38 +141,199 @@ class TestFileProcessingCommand(unittest.TestCase):
         expected = ['Single line\n']
         self.assertEqual(self.command.read_from_stdin(), expected)
 
-    def test_read_stdin_with_contents(self):
-        self.command.contents = ["Contents\n"]
+    def stdin_lines(self):
+        return list(chain.from_iterable(self.command.chunk_stdin()))
+
+    def test_chunk_stdin_with_contents(self):
+        self.command.contents = ["Contents"]
         expected = ["Contents\n"]
-        self.assertEqual(self.command.read_stdin(), expected)
+        self.assertEqual(self.stdin_lines(), expected)
 
     @patch('sys.stdin', new_callable=StringIO)
-    def test_read_stdin_with_input_redirection(self, mock_stdin):
+    def test_chunk_stdin_with_here_document(self, mock_stdin):
         mock_stdin.write('Line 1\n')
         mock_stdin.write('Line 2\n')
         mock_stdin.write('Line 3\n')
         mock_stdin.seek(0)
-        self.command.inputFile = ("test_file.txt", True)
-        expected = ['Line 1\n', 'Line 2\n', 'Line 3\n']
-        self.assertEqual(self.command.read_stdin(), expected)
+        self.command.inputFile = ("Line 3", True)
+        expected = ['Line 1\n', 'Line 2\n']
+        self.assertEqual(self.stdin_lines(), expected)
 
     @patch('sys.stdin', new_callable=StringIO)
-    def test_read_stdin_no_input_file(self, mock_stdin):
+    def test_chunk_stdin_no_input_file(self, mock_stdin):
         mock_stdin.write("Input\n")
         mock_stdin.seek(0)
         self.command.inputFile = None
         expected = ['Input\n']
-        self.assertEqual(self.command.read_stdin(), expected)
+        self.assertEqual(self.stdin_lines(), expected)
 
-    def test_read_stdin_input_file(self):
+    def test_chunk_stdin_input_file(self):
         self.command.inputFile = ("test_file.txt", False)
         expected = ['Line 1\n', 'Line 2\n', 'Line 3\n']
-        self.assertEqual(self.command.read_stdin(), expected)
+        self.assertEqual(self.stdin_lines(), expected)
 
     @patch('sys.stdin', new_callable=StringIO)
-    def test_read_stdin_with_empty_contents(self, mock_stdin):
+    def test_chunk_stdin_with_empty_contents(self, mock_stdin):
+        mock_stdin.write("Input\n")
+        mock_stdin.seek(0)
         self.command.contents = []
-        self.assertEqual(self.command.read_stdin(), [])
+        self.assertEqual(self.stdin_lines(), ['Input\n'])
+
+    def test_stream_file(self):
+        lines = self.command.stream_file(['test_file.txt', 'nested_dir/nested_file.txt'])
+        self.assertEqual(next(lines), 'Line 1\n')
+        self.assertEqual(list(lines)[-1], 'Nested line 2\n')
+
+    def test_stream_file_missing_is_reported_before_reading(self):
+        with self.assertRaises(ValueError) as context:
+            self.command.stream_file(['nonexistent_file.txt'])
+        self.assertIn("Error reading file", str(context.exception))
+
+    @patch('sys.stdin', new_callable=StringIO)
+    def test_chunk_stdin_with_piped_stream(self, mock_stdin):
+        mock_stdin.write("Input\n")
+        mock_stdin.seek(0)
+        self.command.contents = iter(['Piped'])
+        self.assertEqual(self.stdin_lines(), ['Piped\n'])
+        # An empty stream from a pipe is still piped input
+        self.command.contents = iter([])
+        self.assertEqual(list(self.command.chunk_contents(None)), [])
+
+    def test_chunk_file(self):
+        with open('no_newline.txt', 'w') as f:
+            f.write('a\nb')
+        chunks = list(self.command.chunk_file(['no_newline.txt', 'test_file.txt']))
+        self.assertEqual(chunks, [['a\n', 'b\n'], ['Line 1\n', 'Line 2\n', 'Line 3\n']])
+
+    @patch('shellFileProcessing.READ_SIZE', 4)
+    def test_read_file_in_chunks(self):
+        with open('no_newline.txt', 'w') as f:
+            f.write('first line\nsecond\nlast')
+        self.assertEqual(list(self.command.chunk_file(['no_newline.txt']))[-1], ['last\n'])
+        self.assertEqual(self.command.read_file(['no_newline.txt']), ['first line\n', 'second\n', 'last\n'])
+        self.assertEqual(self.command.read_file(['no_newline.txt'], True), [['no_newline.txt', 'first line\n', 'second\n', 'last\n']])
+
+    @patch('shellFileProcessing.CHUNK_SIZE', 2)
+    def test_chunk_lines(self):
+        chunks = self.command.chunk_lines(iter(['a', 'b\n', 'c']))
+        self.assertEqual(list(chunks), [['a\n', 'b\n'], ['c\n']])
+        self.assertEqual(list(self.command.chunk_lines([])), [])
+
+    def test_chunk_stdin_passes_chunks_on(self):
+        chunk = ['Piped\n']
+        self.command.contents = Chunks(iter([chunk]))
+        self.assertIs(next(self.command.chunk_stdin()), chunk)
+
+    @patch('shellFileProcessing.MMAP_SIZE', 1)
+    def test_map_file(self):
+        with open('no_newline.txt', 'w') as f:
+            f.write('first line\nsecond\nlast')
+        with self.command.map_file('no_newline.txt') as mapped:
+            self.assertEqual(len(mapped), 22)
+            self.assertEqual(list(mapped.find_lines(b'st')), [b'first line\n', b'last\n'])
+            self.assertEqual(list(mapped.find_lines(b'x')), [])
+
+    @patch('shellFileProcessing.MMAP_SIZE', 1)
+    def test_map_file_falls_back_to_text(self):
+        with open('crlf.txt', 'w', newline='') as f:
+            f.write('a\r\nb\r\n')
+        self.assertIsNone(self.command.map_file('crlf.txt'))
+        self.assertIsNone(self.command.map_file('nonexistent_file.txt'))
+        self.assertIsNone(self.command.map_file('nested_dir'))
+        self.assertIsNone(self.command.map_file('/dev/stdin'))
+        with patch('shellFileProcessing.MMAP_SIZE', 1 << 20):
+            self.assertIsNone(self.command.map_file('test_file.txt'))
+
+    @patch('shellFileProcessing.READ_SIZE', 3)
+    def test_find_last_lines(self):
+        with open('lines.txt', 'w', newline='') as f:
+            f.write('one\ntwo\nthree\n')
+        with open('lines.txt', 'rb') as file:
+            self.assertEqual([find_last_lines(file, count) for count in range(5)], [14, 8, 4, 0, 0])
+        with open('crlf.txt', 'w', newline='') as f:
+            f.write('one\r\ntwo\r\n')
+        with open('crlf.txt', 'rb') as file:
+            self.assertIsNone(find_last_lines(file, 1))
+        self.assertIsNone(self.command.read_last_lines('crlf.txt', 1))
+        self.assertEqual(self.command.read_last_lines('lines.txt', 2), ['two\n', 'three\n'])
+        self.assertIsNone(self.command.read_last_lines('nonexistent_file.txt', 1))
+
+
+class TestFileCache(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        cwd = os.getcwd()
+        os.chdir(self.temp_dir.name)
+        self.addCleanup(os.chdir, cwd)
+
+        # Room for two files of one short line
+        self.entry = self.size_of(("1234567\n",))
+        self.cache = FileCache(maxbytes=2 * self.entry)
+        for patcher in [patch('shellFileProcessing.FILE_CACHE', self.cache),
+                        patch('shellFileProcessing.FILE_CACHE_SETTLE', 0)]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.command = FileProcessingCommand([], [], {"inputFile": None, "contents": None})
+
+    def write(self, name, text, mtime_ns=10 ** 18):
+        with open(name, "w") as f:
+            f.write(text)
+        os.utime(name, ns=(mtime_ns, mtime_ns))
+
+    def read(self, name):
+        return list(self.command.stream_file([name]))
+
+    # Memory a file of these lines takes in the cache
+    def size_of(self, lines):
+        chunks = (tuple(lines),)
+        return sys.getsizeof(chunks) + chunk_size(chunks[0])
+
+    def test_hit_until_the_file_changes(self):
+        self.write("a.txt", "one\ntwo")
+        self.assertEqual(self.read("a.txt"), ["one\n", "two\n"])
+        self.assertEqual(self.read("a.txt"), ["one\n", "two\n"])
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        # Same size, different time
+        self.write("a.txt", "six\nten", 10 ** 18 + 10 ** 9)
+        self.assertEqual(self.read("a.txt"), ["six\n", "ten\n"])
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 2))
+        size = self.size_of(["six\n", "ten\n"])
+        self.assertEqual(self.cache.list(), [f"{size} {os.path.abspath('a.txt')}\n"])
+
+    def test_evicts_least_recently_used_by_size(self):
+        for name in ["a.txt", "b.txt", "c.txt"]:
+            self.write(name, "1234567\n")
+        self.read("a.txt")
+        self.read("b.txt")
+        self.read("a.txt")
+        self.read("c.txt")
+        self.assertEqual([line.split()[1] for line in self.cache.list()],
+                         [os.path.abspath("a.txt"), os.path.abspath("c.txt")])
+        self.assertEqual(self.cache.info()["size"], 2 * self.entry)
+        self.cache.resize(self.entry)
+        self.assertEqual(self.cache.info()["files"], 1)
+
+    def test_skips_partial_large_and_recent_reads(self):
+        self.write("big.txt", "x" * (self.cache.maxbytes + 1))
+        self.read("big.txt")
+        # Small on disk, but not once decoded
+        self.write("lines.txt", "a\n" * (self.cache.maxbytes // 4))
+        self.read("lines.txt")
+        self.write("a.txt", "a\nb\n")
+        next(self.command.stream_file(["a.txt"]))
+        with patch('shellFileProcessing.FILE_CACHE_SETTLE', 60):
+            self.write("new.txt", "new\n", time.time_ns())
+            self.read("new.txt")
+        self.assertEqual(self.cache.info()["files"], 0)
+
+    def test_cached_chunks_are_copies(self):
+        self.write("a.txt", "one\n")
+        self.command.read_file(["a.txt"])
+        self.command.read_file(["a.txt"]).append("changed")
+        self.assertEqual(self.command.read_file(["a.txt"]), ["one\n"])
+        self.cache.clear()
+        self.assertEqual(self.cache.info(), {"hits": 0, "misses": 0, "files": 0, "size": 0, "maxbytes": 2 * self.entry})
 
 
 if __name__ == '__main__':
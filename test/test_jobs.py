@@ -0,0 +1,117 @@
+import os
+import threading
+import time
+import unittest
+from unittest.mock import patch
+import sys
+sys.path.append('./src')
+from collections import deque
+from shellAst import Call, Pipe, Redirect
+from shellJobs import JOBS, describe
+from shellParsing import CommandParser
+from shellDecorator import commandRegistry
+from shellFileProcessing import FileProcessingCommand
+
+
+def run_line(cmdline):
+    out = deque()
+    CommandParser(cmdline, out).parse()
+    return list(out)
+
+
+class TestJobs(unittest.TestCase):
+    def setUp(self):
+        # Jobs left by a failing test must not leak into the next one
+        self.addCleanup(lambda: JOBS.wait(deque()) if JOBS.jobs else None)
+        released = threading.Event()
+
+        # Blocks until a later job releases it, so it only finishes if jobs overlap
+        class Block(FileProcessingCommand):
+            def execute(self):
+                if not released.wait(5):
+                    raise ValueError("not released")
+                self.out.append("blocked\n")
+
+        class Release(FileProcessingCommand):
+            def execute(self):
+                released.set()
+                self.out.append("released\n")
+
+        registry = patch.dict(commandRegistry, {"block": Block, "release": Release})
+        registry.start()
+        self.addCleanup(registry.stop)
+
+    def test_jobs_run_concurrently_in_order(self):
+        out = run_line("block & release & echo now; wait")
+        self.assertEqual(out, ["now\n", "blocked\n", "released\n"])
+
+    def test_wait_for_given_jobs(self):
+        self.assertEqual(run_line("echo a & echo b & wait %2"), ["b\n"])
+        self.assertEqual(run_line("jobs"), ["[1] Done echo a\n"])
+        self.assertEqual(run_line("wait 1; jobs"), ["a\n"])
+
+    def test_numbers_reused_once_waited(self):
+        run_line("echo a & wait")
+        self.assertEqual(run_line("echo b | cat > /dev/null & jobs; wait"),
+                         ["[1] Running echo b | cat > /dev/null\n"])
+
+    def test_failed_job_reported_after_output(self):
+        out = deque()
+        with self.assertRaises(ValueError) as context:
+            CommandParser("nosuchapp & echo a & wait", out).parse()
+        self.assertIn("Job [1] failed", str(context.exception))
+        self.assertIn("Unknown application: nosuchapp", str(context.exception))
+        self.assertEqual(list(out), ["a\n"])
+        self.assertEqual(JOBS.jobs, {})
+
+    def test_invalid_wait(self):
+        for cmdline, message in (("wait 3", "No such job: 3"), ("wait x", "Invalid wait arguments"),
+                                 ("jobs x", "Invalid jobs arguments")):
+            with self.subTest(cmdline=cmdline):
+                with self.assertRaises(ValueError) as context:
+                    run_line(cmdline)
+                self.assertIn(message, str(context.exception))
+
+    def test_wait_inside_job(self):
+        out = run_line("_wait & wait")
+        self.assertEqual(len(out), 1)
+        self.assertIn("Cannot wait inside a background job", out[0])
+        with self.assertRaises(ValueError) as context:
+            run_line("wait & wait")
+        self.assertIn("Job [1] failed", str(context.exception))
+
+    # The foreground directory is the same after the job, whichever thread ran the cd
+    def test_cd_inside_job(self):
+        cwd = os.getcwd()
+        for cmdline, mode in (("_cd test", "stream"), ("_cd test | cat", "threads")):
+            with self.subTest(cmdline=cmdline), patch('shellPlan.PIPELINE_MODE', mode):
+                out = run_line(f"{cmdline} & pwd; wait; pwd")
+                self.assertEqual(len(out), 3)
+                self.assertIn("Cannot cd inside a background job", out[1])
+                self.assertEqual([out[0], out[2]], [cwd + "\n"] * 2)
+                self.assertEqual(os.getcwd(), cwd)
+
+    # Jobs started before a cd read and write where the shell was when they started
+    def test_cd_waits_for_jobs(self):
+        cwd = os.getcwd()
+        self.addCleanup(os.chdir, cwd)
+
+        class Where(FileProcessingCommand):
+            def execute(self):
+                time.sleep(0.1)
+                self.out.append(os.getcwd() + "\n")
+
+        with patch.dict(commandRegistry, {"where": Where}):
+            out = run_line("where & where > where.txt & cd test; pwd; wait")
+        self.addCleanup(os.remove, os.path.join(cwd, "where.txt"))
+        self.assertEqual(out, [os.path.join(cwd, "test") + "\n", cwd + "\n"])
+        with open(os.path.join(cwd, "where.txt")) as f:
+            self.assertEqual(f.read(), cwd + "\n")
+
+    def test_describe(self):
+        node = Pipe((Call("cat", (Redirect("input", "a.txt"),)), Call("sort", (Redirect("output", "b", True),))))
+        self.assertEqual(describe(node), "cat < a.txt | sort >> b")
+
+
+if __name__ == "__main__":
+    unittest.main()
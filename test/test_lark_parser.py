@@ -1,8 +1,17 @@
 import unittest
+import os
+import random
+import pickle
+import tempfile
 import sys
 sys.path.append('./src')
-from shellLarkParser import larkParser, LARK_GRAMMAR
-from lark import Tree, Token
+from shellLarkParser import larkParser, get_parser, LARK_GRAMMAR, PARSER_CACHE
+from shellLarkParser import grammar_hash, build_grammar_cache, load_grammar_cache
+from shellLarkParser import lalr_parser, ShellCommandTransformer
+from unittest.mock import patch, MagicMock
+from lark.exceptions import UnexpectedEOF
+from lark import Lark
+from shellAst import Call, Pipe, Seq, Redirect, Substitution, Background
 
 
 class TestShellCommandTransformer(unittest.TestCase):
@@ -14,64 +23,227 @@ class TestShellCommandTransformer(unittest.TestCase):
 
     def test_normal_command(self):
         result = self.parse_and_transform("echo test")
-        expected = {'call': [{'normal': [Token('__ANON_0', 'echo test')]}]}
+        expected = Call("echo test")
         self.assertEqual(result, expected)
 
     def test_sequence_command(self):
         result = self.parse_and_transform("echo first; echo second")
-        expected = {'seq': [{'command': [{'call': [{'normal': [Token('__ANON_0', 'echo first')]}]}]}, {'command': [{'call': [{'normal': [Token('__ANON_0', 'echo second')]}]}]}]}
+        expected = Seq((Call("echo first"), Call("echo second")))
         self.assertEqual(result, expected)
 
     def test_pipe_command(self):
         result = self.parse_and_transform("cat file | grep text")
-        expected = {'pipe': [{'call': [{'normal': [Token('__ANON_0', 'cat file ')]}]}, {'call': [{'normal': [Token('__ANON_0', 'grep text')]}]}]}
+        expected = Pipe((Call("cat file"), Call("grep text")))
         self.assertEqual(result, expected)
 
     def test_quoted_command(self):
         result = self.parse_and_transform("echo 'hello world'")
-        expected = {'call': [{'normal': [Token('__ANON_0', 'echo ')]}, {'quoted': [{'single_quoted': [{'inner': [Token('__ANON_1', 'hello world')]}]}]}]}
+        expected = Call("echo hello world")
         self.assertEqual(result, expected)
 
     def test_single_in_double(self):
         result = self.parse_and_transform("echo \"'abc'\"")
-        expected = {'call': [{'normal': [Token('__ANON_0', 'echo ')]}, {'quoted': [{'double_quoted': [{'single_quoted': [{'inner': [Token('__ANON_1', 'abc')]}]}]}]}]}
+        expected = Call("echo 'abc'")
         self.assertEqual(result, expected)
 
     def test_back_in_double(self):
         result = self.parse_and_transform("echo \"`echo abc`\"")
-        expected = {'call': [{'normal': [Token('__ANON_0', 'echo ')]}, {'quoted': [{'double_quoted': [{'backquoted': [{'inner': [Token('__ANON_1', 'echo abc')]}]}]}]}]}
+        expected = Call("echo `echo abc`", (), Substitution("echo ", Call("echo abc"), ""))
         self.assertEqual(result, expected)
 
     def test_double_in_single(self):
         result = self.parse_and_transform("echo 'This is a \"nested\" quote'")
-        expected = {'call': [{'normal': [Token('__ANON_0', 'echo ')]}, {'quoted': [{'single_quoted': [{'inner': [Token('__ANON_1', 'This is a ')]}, {'double_quoted': [{'inner': [Token('__ANON_1', 'nested')]}]}, {'inner': [Token('__ANON_1', ' quote')]}]}]}]}
+        expected = Call('echo This is a "nested" quote')
         self.assertEqual(result, expected)
 
     def test_back_in_single(self):
         result = self.parse_and_transform("echo '`echo disqualified`'")
-        expected = {'call': [{'normal': [Token('__ANON_0', 'echo ')]}, {'quoted': [{'single_quoted': [{'backquoted': [{'inner': [Token('__ANON_1', 'echo disqualified')]}]}]}]}]}
+        expected = Call("echo `echo disqualified`")
         self.assertEqual(result, expected)
 
     def test_single_in_back(self):
         result = self.parse_and_transform("echo `echo 'abc'`")
-        expected = {'call': [{'normal': [Token('__ANON_0', 'echo ')]}, {'quoted': [{'backquoted': [{'inner': [Token('__ANON_1', 'echo ')]}, {'single_quoted': [{'inner': [Token('__ANON_1', 'abc')]}]}]}]}]}
+        expected = Call("echo `echo 'abc'`", (), Substitution("echo ", Call("echo abc"), ""))
         self.assertEqual(result, expected)
 
     def test_double_in_back(self):
         result = self.parse_and_transform("echo `echo \"abc\"`")
-        expected = {'call': [{'normal': [Token('__ANON_0', 'echo ')]}, {'quoted': [{'backquoted': [{'inner': [Token('__ANON_1', 'echo ')]}, {'double_quoted': [{'inner': [Token('__ANON_1', 'abc')]}]}]}]}]}
+        expected = Call('echo `echo "abc"`', (), Substitution("echo ", Call("echo abc"), ""))
         self.assertEqual(result, expected)
 
     def test_backquoted_command(self):
         result = self.parse_and_transform("echo `date`")
-        expected = {'call': [{'normal': [Token('__ANON_0', 'echo ')]}, {'quoted': [{'backquoted': [{'inner': [Token('__ANON_1', 'date')]}]}]}]}
+        expected = Call("echo `date`", (), Substitution("echo ", Call("date"), ""))
         self.assertEqual(result, expected)
 
     def test_io_redirection(self):
         result = self.parse_and_transform("grep text < file.txt")
-        expected = {'call': [{'normal': [Token('__ANON_0', 'grep text ')]}, {'io_redirection': [{'input_redirection': [Tree(Token('RULE', 'filename'), [Token('__ANON_4', 'file.txt')])]}]}]}
+        expected = Call("grep text", (Redirect("input", "file.txt"),))
         self.assertEqual(result, expected)
 
+    def test_whitespace_collapsed_outside_quotes(self):
+        result = self.parse_and_transform("  echo a \t b 'c  d'")
+        expected = Call("echo a b c  d")
+        self.assertEqual(result, expected)
+
+    def test_nested_sequence_and_pipe(self):
+        result = self.parse_and_transform("a | b | c; d; e | f")
+        expected = Seq((Pipe((Call("a"), Call("b"), Call("c"))), Call("d"), Pipe((Call("e"), Call("f")))))
+        self.assertEqual(result, expected)
+
+    def test_nested_backquotes_raise(self):
+        with self.assertRaises(ValueError) as context:
+            self.parse_and_transform("echo `echo \"`echo abc`\"`")
+        self.assertEqual(str(context.exception), "Invalid command substitution syntax")
+
+    def test_output_redirection_mid_pipeline_raises(self):
+        for cmdline in ("a > o.txt | b", "a | b > o.txt | c"):
+            with self.assertRaises(ValueError) as context:
+                self.parse_and_transform(cmdline)
+            self.assertEqual(str(context.exception), "Output redirection in the middle of a pipeline")
+
+    def test_background_jobs(self):
+        cases = {
+            "find a &": Background(Call("find a")),
+            "find a & find b": Seq((Background(Call("find a")), Call("find b"))),
+            "cat f | grep x > o &": Background(Pipe((Call("cat f"), Call("grep x", (Redirect("output", "o"),))))),
+            "a&b & c; d": Seq((Background(Call("a")), Background(Call("b")), Call("c"), Call("d"))),
+            "echo 'a & b'": Call("echo a & b"),
+        }
+        for cmdline, expected in cases.items():
+            with self.subTest(cmdline=cmdline):
+                self.assertEqual(self.parse_and_transform(cmdline), expected)
+
+    def test_background_without_command_raises(self):
+        for cmdline in ("&", "& a", "a & & b", "a; & b"):
+            with self.subTest(cmdline=cmdline):
+                with self.assertRaises(ValueError) as context:
+                    self.parse_and_transform(cmdline)
+                self.assertEqual(str(context.exception), "Missing command before '&'")
+
+    def test_parser_is_cached(self):
+        self.parse_and_transform("echo first")
+        parser = get_parser(LARK_GRAMMAR)
+        self.parse_and_transform("echo second")
+        self.assertIs(get_parser(LARK_GRAMMAR), parser)
+        self.assertIn((LARK_GRAMMAR, (("parser", "earley"), ("start", "command"))), PARSER_CACHE)
+
+    def test_parser_cache_keyed_by_options(self):
+        earley = get_parser(LARK_GRAMMAR)
+        lalr = get_parser(LARK_GRAMMAR, parser="lalr")
+        self.assertIsNot(earley, lalr)
+        self.assertIs(get_parser(LARK_GRAMMAR, parser="lalr"), lalr)
+
+
+class TestGrammarCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "grammar.cache")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def read_cache(self):
+        with open(self.path, "rb") as f:
+            return pickle.load(f)
+
+    def test_build_writes_grammar_hash(self):
+        build_grammar_cache(LARK_GRAMMAR, self.path)
+        self.assertEqual(self.read_cache()["hash"], grammar_hash(LARK_GRAMMAR))
+
+    def test_load_regenerates_missing_cache(self):
+        self.assertIsNotNone(load_grammar_cache(LARK_GRAMMAR, self.path))
+        self.assertTrue(os.path.exists(self.path))
+
+    def test_load_regenerates_when_grammar_changes(self):
+        build_grammar_cache(LARK_GRAMMAR, self.path)
+        changed = LARK_GRAMMAR + "\n    unused: \"x\"\n"
+        load_grammar_cache(changed, self.path)
+        self.assertEqual(self.read_cache()["hash"], grammar_hash(changed))
+
+    def test_load_regenerates_corrupt_cache(self):
+        with open(self.path, "wb") as f:
+            f.write(b"not a pickle")
+        load_grammar_cache(LARK_GRAMMAR, self.path)
+        self.assertEqual(self.read_cache()["hash"], grammar_hash(LARK_GRAMMAR))
+
+    def test_loaded_grammar_parses(self):
+        build_grammar_cache(LARK_GRAMMAR, self.path)
+        grammar = load_grammar_cache(LARK_GRAMMAR, self.path)
+        parser = Lark(grammar, start="command", parser="earley")
+        self.assertEqual(parser.parse("echo a | cat"), get_parser(LARK_GRAMMAR).parse("echo a | cat"))
+
+
+# Lines both parsing modes must accept and agree on
+DIFFERENTIAL_CORPUS = [
+    "", ";", "echo foo", "  echo a", "echo a  b", "echo a\tb", "echo x;", "echo ;;",
+    "echo a; echo b", "echo a; echo b; echo c", "a;b", "a ; b", "a;  b",
+    "a | b", "a |b", "a|  b", "a | b | c", "a | b; c | d", "a|b|c|d;e;f|g", "echo |", "| echo",
+    "echo 'hello world'", "echo '' x", "echo \"\"", "echo a 'b'c", "echo \"a\" \"b\"",
+    "echo \"'abc'\"", "echo 'This is a \"nested\" quote'", "echo \"a `b` c\"",
+    "echo `date`", "echo `echo 'abc'`", "echo `echo \"a 'b' c\"`", "echo '`echo x`'",
+    "echo \"`echo 'x'`\"", "echo 'a \"b `c` d\" e'", "echo \"a\nb\"", "echo a\nb",
+    "cat < f.txt", "cat <f.txt", "cat<f", "< f cat", "echo a > out.txt", "cat >> o",
+    "cat << EOF", "a > f b", "cat f | grep x > o", "cat dir1/file1.txt | grep AAA | sort -r > out-1.txt",
+    "a &", "a & b", "a &b", "a | b & c; d &", "echo 'a & b' &",
+]
+
+
+class TestParserModes(unittest.TestCase):
+    @staticmethod
+    def transform(parser, cmdline):
+        return ShellCommandTransformer().transform(parser.parse(cmdline))
+
+    def test_lalr_accepts_corpus(self):
+        parser = lalr_parser(LARK_GRAMMAR)
+        for cmdline in DIFFERENTIAL_CORPUS:
+            with self.subTest(cmdline=cmdline):
+                parser.parse(cmdline)
+
+    def test_modes_agree_on_corpus(self):
+        lalr, earley = lalr_parser(LARK_GRAMMAR), get_parser(LARK_GRAMMAR)
+        for cmdline in DIFFERENTIAL_CORPUS:
+            with self.subTest(cmdline=cmdline):
+                self.assertEqual(self.transform(lalr, cmdline), self.transform(earley, cmdline))
+
+    def test_modes_agree_on_random_lines(self):
+        pieces = ["echo ", "a", "f.txt", " ", "\t", ";", "|", "&", "<", ">", ">>", "<<", "'", "\"", "`", "-n", "\n"]
+        rng = random.Random(0)
+        lalr, earley = lalr_parser(LARK_GRAMMAR), get_parser(LARK_GRAMMAR)
+        for _ in range(300):
+            cmdline = "".join(rng.choice(pieces) for _ in range(rng.randint(0, 10)))
+            try:
+                expected = self.transform(earley, cmdline)
+            except Exception:
+                continue
+            with self.subTest(cmdline=cmdline):
+                self.assertEqual(self.transform(lalr, cmdline), expected)
+
+    def test_modes_agree_on_flat_long_lines(self):
+        cmdline = "; ".join(["echo a | cat | cat"] * 50)
+        result = larkParser(LARK_GRAMMAR, cmdline, "earley")
+        self.assertEqual(result, larkParser(LARK_GRAMMAR, cmdline, "lalr"))
+        self.assertEqual(len(result.commands), 50)
+        self.assertEqual(result.commands[0], Pipe((Call("echo a"), Call("cat"), Call("cat"))))
+
+    def test_larkparser_modes_agree(self):
+        for cmdline in DIFFERENTIAL_CORPUS:
+            with self.subTest(cmdline=cmdline):
+                self.assertEqual(larkParser(LARK_GRAMMAR, cmdline, "lalr"), larkParser(LARK_GRAMMAR, cmdline, "earley"))
+
+    def test_lalr_falls_back_to_earley(self):
+        rejecting = MagicMock()
+        rejecting.parse.side_effect = UnexpectedEOF([])
+        with patch("shellLarkParser.lalr_parser", return_value=rejecting):
+            result = larkParser(LARK_GRAMMAR, "echo test", "lalr")
+        rejecting.parse.assert_called_once_with("echo test")
+        self.assertEqual(result, Call("echo test"))
+
+    def test_invalid_line_raises_in_both_modes(self):
+        for mode in ("lalr", "earley"):
+            with self.assertRaises(ValueError):
+                larkParser(LARK_GRAMMAR, "echo 'unterminated", mode)
+
 
 if __name__ == '__main__':
     unittest.main()
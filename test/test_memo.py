@@ -0,0 +1,171 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+import sys
+sys.path.append('./src')
+from collections import deque
+from shellMemo import MemoCache, Reads, digest_input, fingerprint
+from shellDecorator import commandRegistry, pureCommands
+from shellFileProcessing import FileProcessingCommand, Chunks
+from shellParsing import CommandParser, PARSE_CACHE
+
+
+class TestMemoCache(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        cwd = os.getcwd()
+        os.chdir(self.temp_dir.name)
+        self.addCleanup(os.chdir, cwd)
+        self.write("lines.txt", "b\na\nc\n")
+
+        self.cache = MemoCache(maxsize=4, enabled=True)
+        memo = patch("shellCommandFactory.MEMO_CACHE", self.cache)
+        memo.start()
+        self.addCleanup(memo.stop)
+
+        # Counts its runs, so a cache hit shows as a run that did not happen
+        self.runs = []
+        runs = self.runs
+
+        class Count(FileProcessingCommand):
+            def chunks(self):
+                runs.append(self.args)
+                yield from self.chunk_contents(self.args[0] if self.args else None)
+
+        # Plans resolve commands when compiled, so none may outlive this class
+        PARSE_CACHE.clear()
+        self.addCleanup(PARSE_CACHE.clear)
+        registry = patch.dict(commandRegistry, {"count": Count})
+        registry.start()
+        self.addCleanup(registry.stop)
+        pure = patch("shellMemo.pureCommands", pureCommands | {"count"})
+        pure.start()
+        self.addCleanup(pure.stop)
+        # Files here are written right before they are read
+        settle = patch("shellMemo.MEMO_SETTLE", 0)
+        settle.start()
+        self.addCleanup(settle.stop)
+
+    def write(self, name, text):
+        with open(name, "w") as f:
+            f.write(text)
+
+    def run_line(self, cmdline):
+        out = deque()
+        CommandParser(cmdline, out).parse()
+        return list(out)
+
+    def test_hit_skips_execution(self):
+        self.assertEqual(self.run_line("count lines.txt"), ["b\n", "a\n", "c\n"])
+        self.assertEqual(self.run_line("count lines.txt"), ["b\n", "a\n", "c\n"])
+        self.assertEqual(len(self.runs), 1)
+        self.assertEqual(self.cache.info(), {"hits": 1, "misses": 1, "size": 1, "maxsize": 4})
+
+    def test_changed_file_runs_again(self):
+        self.run_line("count lines.txt")
+        self.write("lines.txt", "changed\n")
+        self.assertEqual(self.run_line("count lines.txt"), ["changed\n"])
+        os.remove("lines.txt")
+        with self.assertRaises(ValueError):
+            self.run_line("count lines.txt")
+        self.assertEqual(len(self.runs), 3)
+
+    def test_piped_input_hashed(self):
+        self.assertEqual(self.run_line("echo x | count"), ["x\n"])
+        self.assertEqual(self.run_line("echo x | count"), ["x\n"])
+        self.assertEqual(self.run_line("echo y | count"), ["y\n"])
+        self.assertEqual(len(self.runs), 2)
+
+    def test_key_includes_cwd_and_redirection(self):
+        os.mkdir("dir")
+        self.write("dir/lines.txt", "other\n")
+        self.run_line("count lines.txt")
+        self.run_line("count < lines.txt")
+        os.chdir("dir")
+        self.assertEqual(self.run_line("count lines.txt"), ["other\n"])
+        self.assertEqual(len(self.runs), 3)
+
+    def test_pipeline_stage_cached(self):
+        self.assertEqual(self.run_line("count lines.txt | sort"), ["a\n", "b\n", "c\n"])
+        self.assertEqual(self.run_line("count lines.txt | head -n 1"), ["b\n"])
+        self.assertEqual(len(self.runs), 1)
+
+    def test_unfinished_run_not_cached(self):
+        with patch("shellMemo.MEMO_ENTRY_SIZE", 4):
+            self.run_line("count lines.txt")
+        self.run_line("cat lines.txt | count")
+        with patch("shellMemo.MEMO_INPUT_SIZE", 4):
+            self.run_line("cat lines.txt | count")
+        self.assertEqual(self.cache.info()["size"], 1)
+
+    def test_terminal_input_not_cached(self):
+        with patch("sys.stdin", ["typed\n"]):
+            self.assertEqual(self.run_line("count"), ["typed\n"])
+        self.assertEqual(self.cache.info()["size"], 0)
+
+    def test_find_sees_new_files(self):
+        self.assertEqual(self.run_line("find -name '*.md'"), [])
+        os.mkdir("docs")
+        self.write("docs/a.md", "")
+        self.assertEqual(self.run_line("find -name '*.md'"), ["./docs/a.md\n"])
+        self.write("docs/b.md", "")
+        self.assertEqual(sorted(self.run_line("find -name '*.md'")), ["./docs/a.md\n", "./docs/b.md\n"])
+
+    def test_glob_directory_tracked(self):
+        self.assertEqual(self.run_line("grep a *.txt"), ["a\n"])
+        self.write("more.txt", "a\n")
+        self.assertEqual(len(self.run_line("grep a *.txt")), 2)
+
+    def test_bounded(self):
+        for i in range(6):
+            self.run_line(f"echo {i} | count")
+        self.assertEqual(self.cache.info()["size"], 4)
+        self.run_line("echo 0 | count")
+        self.assertEqual(len(self.runs), 7)
+
+    def test_disabled(self):
+        self.cache.enabled = False
+        self.run_line("count lines.txt")
+        self.run_line("count lines.txt")
+        self.assertEqual(len(self.runs), 2)
+        self.assertEqual(self.cache.info()["size"], 0)
+
+    def test_reads(self):
+        reads = Reads()
+        reads.add("missing.txt")
+        with open("lines.txt") as f:
+            reads.add("lines.txt", f)
+        self.assertEqual(reads.files, [("missing.txt", None), ("lines.txt", fingerprint("lines.txt"))])
+        self.assertTrue(reads.tracked)
+        reads.add(None)
+        self.assertFalse(reads.tracked)
+
+    def test_recent_change_not_cached(self):
+        with patch("shellMemo.MEMO_SETTLE", 60):
+            self.run_line("count lines.txt")
+            self.run_line("count lines.txt")
+            self.assertEqual(len(self.runs), 2)
+            os.utime("lines.txt", (0, 0))
+            self.run_line("count lines.txt")
+            self.run_line("count lines.txt")
+            self.assertEqual(len(self.runs), 3)
+
+    def test_digest_input(self):
+        digest, contents = digest_input(Chunks(iter([["a\n"], ["b\n"]])))
+        self.assertEqual(list(contents), ["a\n", "b\n"])
+        self.assertEqual(digest, digest_input(["a\n", "b\n"])[0])
+        digest, contents = digest_input(Chunks(iter([["a\n"], ["b\n"], ["c\n"]])), limit=3)
+        self.assertIsNone(digest)
+        self.assertEqual(list(contents), ["a\n", "b\n", "c\n"])
+
+    def test_pure_commands_registered(self):
+        for name in ("grep", "sort", "cut", "uniq", "find", "_grep"):
+            self.assertIn(name, pureCommands)
+        for name in ("cd", "ls", "echo", "cat", "wait"):
+            self.assertNotIn(name, pureCommands)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,138 @@
+import os
+import stat
+import tempfile
+import unittest
+from unittest.mock import patch
+import sys
+sys.path.append('./src')
+from shellOutput import OutputSink, FileSink
+from shellParsing import CommandParser
+from shellDecorator import commandRegistry
+from shellFileProcessing import FileProcessingCommand
+
+
+class TestOutputSink(unittest.TestCase):
+    def setUp(self):
+        self.written = []
+
+    def test_writes_when_buffer_full(self):
+        sink = OutputSink(self.written.append, buffer_size=6)
+        sink.append("ab\n")
+        self.assertEqual(self.written, [])
+        sink.extend(["cd\n", "ef\n"])
+        self.assertEqual(self.written, ["ab\ncd\nef\n"])
+        sink.append("g\n")
+        sink.flush()
+        sink.flush()
+        self.assertEqual(self.written, ["ab\ncd\nef\n", "g\n"])
+
+    def test_line_policy(self):
+        sink = OutputSink(self.written.append, flush_policy="line")
+        sink.append("a\n")
+        sink.extend(iter(["b\n", "c\n"]))
+        self.assertEqual(self.written, ["a\n", "b\nc\n"])
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            OutputSink(self.written.append, flush_policy="never")
+
+    def test_output_written_while_line_runs(self):
+        sink = OutputSink(self.written.append, flush_policy="line")
+        with self.assertRaises(ValueError):
+            CommandParser("echo a; echo b | cat; nosuchapp", sink).parse()
+        self.assertEqual(self.written, ["a\n", "b\n"])
+
+    def test_redirected_output_skips_sink(self):
+        sink = OutputSink(self.written.append)
+        try:
+            CommandParser("echo a > sink_output.txt; echo b | cat >> sink_output.txt", sink).parse()
+            sink.flush()
+            with open("sink_output.txt") as f:
+                self.assertEqual(f.read(), "a\nb\n")
+        finally:
+            os.remove("sink_output.txt")
+        self.assertEqual(self.written, [])
+
+
+class TestFileSink(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        os.chdir(self.dir.name)
+        self.addCleanup(os.chdir, self.cwd)
+        with open("target.txt", "w") as f:
+            f.write("old\n")
+
+        # Writes a few lines and fails on request, recording what it buffered
+        class Lines(FileProcessingCommand):
+            buffered = []
+
+            def execute(self):
+                for i in range(5):
+                    self.out.append(f"{i}\n")
+                    Lines.buffered.append(len(self.out.buffer))
+                if self.args:
+                    raise ValueError("failed")
+
+        self.lines = Lines
+        registry = patch.dict(commandRegistry, {"lines": Lines})
+        registry.start()
+        self.addCleanup(registry.stop)
+
+    def run_line(self, cmdline):
+        CommandParser(cmdline, []).parse()
+
+    def read(self):
+        with open("target.txt") as f:
+            return f.read()
+
+    @patch('shellOutput.BUFFER_SIZE', 4)
+    def test_streamed_while_running(self):
+        self.run_line("lines > target.txt")
+        self.assertEqual(self.read(), "0\n1\n2\n3\n4\n")
+        self.assertLessEqual(max(self.lines.buffered), 1)
+
+    def test_failed_command_keeps_its_output(self):
+        with self.assertRaises(ValueError):
+            self.run_line("lines fail >> target.txt")
+        self.assertEqual(self.read(), "old\n0\n1\n2\n3\n4\n")
+
+    @patch('shellOutput.ATOMIC_REDIRECT', True)
+    def test_atomic(self):
+        os.chmod("target.txt", 0o640)
+        self.run_line("lines > target.txt; lines >> target.txt")
+        self.assertEqual(self.read(), "0\n1\n2\n3\n4\n" * 2)
+        self.assertEqual(stat.S_IMODE(os.stat("target.txt").st_mode), 0o640)
+        self.assertEqual(os.listdir("."), ["target.txt"])
+
+    @patch('shellOutput.ATOMIC_REDIRECT', True)
+    def test_atomic_failure_keeps_target(self):
+        for cmdline in ("lines fail > target.txt", "lines fail >> target.txt", "nosuchapp > new.txt"):
+            with self.subTest(cmdline=cmdline):
+                with self.assertRaises(ValueError):
+                    self.run_line(cmdline)
+                self.assertEqual(self.read(), "old\n")
+                self.assertEqual(os.listdir("."), ["target.txt"])
+
+    # Appending keeps the bytes of the target, not only text that decodes
+    @patch('shellOutput.ATOMIC_REDIRECT', True)
+    def test_atomic_append_keeps_bytes(self):
+        for old in (b"old\r\nline\r\n", b"\xff\xfe old\n"):
+            with self.subTest(old=old):
+                with open("target.txt", "wb") as f:
+                    f.write(old)
+                self.run_line("lines >> target.txt")
+                with open("target.txt", "rb") as f:
+                    self.assertEqual(f.read(), old + b"0\n1\n2\n3\n4\n")
+
+    def test_new_file_permissions(self):
+        # The umask is left to the system, never changed to be read
+        with patch('os.umask', side_effect=AssertionError("umask changed")):
+            FileSink("new.txt", atomic=True).close()
+        FileSink("plain.txt").close()
+        self.assertEqual(os.stat("new.txt").st_mode, os.stat("plain.txt").st_mode)
+
+
+if __name__ == "__main__":
+    unittest.main()
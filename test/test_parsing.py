@@ -1,8 +1,12 @@
 import unittest
+import random
+from collections import deque
+from unittest.mock import patch
 import sys
 sys.path.append('./src')
-from shellParsing import CommandParser
-from lark import Tree, Token
+from shellParsing import CommandParser, ScriptParser, ParseCache, PARSE_CACHE, simpleParser
+from shellLarkParser import larkParser, LARK_GRAMMAR
+from shellAst import Call, Pipe, Seq, Redirect, Substitution
 
 
 class TestCommandParser(unittest.TestCase):
@@ -14,109 +18,79 @@ class TestCommandParser(unittest.TestCase):
     def tearDown(self):
         pass
 
-    def test_initialize(self):
-        self.parser.initialize()
-        self.assertIsNone(self.parser.disqualified)
-        self.assertEqual(self.parser.backquote, "")
-        self.assertEqual(self.parser.before_backquote, "")
-        self.assertEqual(self.parser.after_backquote, "")
-        self.assertEqual(self.parser.io_redirection, [])
+    def parse_tree(self, cmdline):
+        self.parser.cmdline = cmdline
+        return self.parser.parse_tree()
 
     def test_parse_quoted(self):
-        quoted = [{"double_quoted": [{"inner": ["Hello "]}, {"single_quoted": [{"inner": [" World "]}]}, {"double_quoted": [{"inner": ["Python"]}]}]}]
-        result = self.parser.parse_quoted(quoted)
-        self.assertEqual(result, 'Hello \' World \'"Python"')
+        result = self.parse_tree("echo \"Hello ' World '\"'\"Python\"'")
+        self.assertEqual(result, Call('echo Hello \' World \'"Python"'))
 
     def test_parse_io_redirection_input(self):
-        io_redirection = [{'input_redirection': [Tree(Token('RULE', 'filename'), [Token('__ANON_2', 'input.txt')])]}]
-        result = self.parser.parse_io_redirection(io_redirection)
-        self.assertEqual(result, [('input', 'input.txt', False)])
+        result = self.parse_tree("cat < input.txt")
+        self.assertEqual(result.redirects, (Redirect('input', 'input.txt', False),))
 
     def test_parse_io_redirection_output(self):
-        io_redirection = [{'output_redirection': [Tree(Token('RULE', 'filename'), [Token('__ANON_2', 'output.txt')])]}]
-        result = self.parser.parse_io_redirection(io_redirection)
-        self.assertEqual(result, [('output', 'output.txt', False)])
- 
+        result = self.parse_tree("cat > output.txt")
+        self.assertEqual(result.redirects, (Redirect('output', 'output.txt', False),))
+
     def test_parse_io_redirection_both(self):
-        io_redirection = [{'input_redirection': [Tree(Token('RULE', 'filename'), [Token('__ANON_2', 'input.txt')])]},
-                          {'output_redirection': [Tree(Token('RULE', 'filename'), [Token('__ANON_2', 'output.txt')])]}]
-        result = self.parser.parse_io_redirection(io_redirection)
-        self.assertEqual(result, [('input', 'input.txt', False), ('output', 'output.txt', False)])
+        result = self.parse_tree("cat < input.txt > output.txt")
+        self.assertEqual(result.redirects, (Redirect('input', 'input.txt', False), Redirect('output', 'output.txt', False)))
 
     def test_parse_io_redirection_heredoc(self):
-        io_redirection = [{'heredoc_redirection': [Tree(Token('RULE', 'filename'), [Token('__ANON_2', 'input.txt')])]}]
-        result = self.parser.parse_io_redirection(io_redirection)
-        self.assertEqual(result, [('input', 'input.txt', True)])
+        result = self.parse_tree("cat << input.txt")
+        self.assertEqual(result.redirects, (Redirect('input', 'input.txt', True),))
 
     def test_parse_io_redirection_append(self):
-        io_redirection = [{'append_redirection': [Tree(Token('RULE', 'filename'), [Token('__ANON_2', 'output.txt')])]}]
-        result = self.parser.parse_io_redirection(io_redirection)
-        self.assertEqual(result, [('output', 'output.txt', True)])
+        result = self.parse_tree("cat >> output.txt")
+        self.assertEqual(result.redirects, (Redirect('output', 'output.txt', True),))
 
     def test_parse_io_redirection_last_in_pipe(self):
-        io_redirection = [{'output_redirection': [Tree(Token('RULE', 'filename'), [Token('__ANON_2', 'o.txt')])]}]
         with self.assertRaises(ValueError) as context:
-            self.parser.parse_io_redirection(io_redirection, True, False)
+            self.parse_tree("cat > o.txt | cat")
         self.assertIn("Output redirection in the middle of a pipeline", str(context.exception))
 
+    def test_parse_io_redirection_last_in_pipe_allowed(self):
+        result = self.parse_tree("cat | cat > o.txt")
+        self.assertEqual(result.commands[1].redirects, (Redirect('output', 'o.txt', False),))
+
     def test_parse_io_redirection_none(self):
-        io_redirection = {}
-        result = self.parser.parse_io_redirection(io_redirection)
-        self.assertEqual(result, [])
-
-    def test_process_command_part_normal(self):
-        part = {"normal": [Token('__ANON_0', 'echo Hello')]}
-        result = self.parser.process_command_part(part, False, False)
-        self.assertEqual(result, "echo Hello")
-
-    def test_process_command_part_quoted(self):
-        part = {'quoted': [{'double_quoted': [{'inner': [Token('__ANON_1', 'hello')]}]}]}
-        result = self.parser.process_command_part(part, False, False)
-        self.assertEqual(result, 'hello')
-
-    def test_process_command_part_io_redirection(self):
-        part = {'io_redirection': [{'output_redirection': [Tree(Token('RULE', 'filename'), [Token('__ANON_4', 'o.txt')])]}]}
-        result = self.parser.process_command_part(part, False, False)
-        self.assertEqual(result, "")
-
-    def test_parsed_command_list_with_call(self):
-        command_structure = {"call": [{"normal": [Token('__ANON_0', 'echo Hello')]}]}
-        result = []
-        self.parser.parsed_command_list(command_structure, result)
-        self.assertEqual(result, [{"call": {"before_backquote": "echo Hello", "backquote": "", "after_backquote": "", "disqualified": None, "io_redirection": [], "command": "echo Hello"}}])
-
-    def test_parsed_command_list_with_call_back_quote(self):
-        command_structure = {"call": [{'normal': [Token('__ANON_0', 'echo ')]}, {'quoted': [{'backquoted': [{'inner': [Token('__ANON_1', 'echo hello')]}]}]}]}
-        result = []
-        self.parser.parsed_command_list(command_structure, result)
-        self.assertEqual(result, [{'call': {'before_backquote': 'echo ', 'backquote': [{'call': {'before_backquote': 'echo hello', 'backquote': '', 'after_backquote': '', 'disqualified': None, 'io_redirection': [], 'command': 'echo hello'}}], 'after_backquote': '', 'disqualified': None, 'io_redirection': [], 'command': 'echo `echo hello`'}}])
-
-    def test_parsed_command_list_with_call_seq(self):
-        command_structure = {'seq': [{'command': [{'call': [{'normal': [Token('__ANON_0', 'echo hello ')]}]}]}, {'command': [{'call': [{'normal': [Token('__ANON_0', 'echo world')]}]}]}]}
-        result = []
-        self.parser.parsed_command_list(command_structure, result)
-        self.assertEqual(result, [{'seq': [{'call': {'before_backquote': 'echo hello', 'backquote': '', 'after_backquote': '', 'disqualified': None, 'io_redirection': [], 'command': 'echo hello'}}, {'call': {'before_backquote': 'echo world', 'backquote': '', 'after_backquote': '', 'disqualified': None, 'io_redirection': [], 'command': 'echo world'}}]}])
-
-    def test_parsed_command_list_with_call_back_pipe(self):
-        command_structure = {'pipe': [{'call': [{'normal': [Token('__ANON_0', 'echo hello ')]}]}, {'call': [{'normal': [Token('__ANON_0', 'echo world')]}]}]}
-        result = []
-        self.parser.parsed_command_list(command_structure, result)
-        self.assertEqual(result, [{'pipe': [{'call': {'before_backquote': 'echo hello', 'backquote': '', 'after_backquote': '', 'disqualified': None, 'io_redirection': [], 'command': 'echo hello'}}, {'call': {'before_backquote': 'echo world', 'backquote': '', 'after_backquote': '', 'disqualified': None, 'io_redirection': [], 'command': 'echo world'}}]}])
+        result = self.parse_tree("cat")
+        self.assertEqual(result.redirects, ())
+
+    def test_parse_normal(self):
+        result = self.parse_tree("echo   Hello")
+        self.assertEqual(result, Call("echo Hello"))
+
+    def test_parse_with_call(self):
+        result = self.parse_tree("echo Hello")
+        self.assertEqual(result, Call("echo Hello", (), None))
+
+    def test_parse_with_call_back_quote(self):
+        result = self.parse_tree("echo `echo hello`")
+        self.assertEqual(result, Call("echo `echo hello`", (), Substitution("echo ", Call("echo hello"), "")))
+
+    def test_parse_with_call_seq(self):
+        result = self.parse_tree("echo hello ; echo world")
+        self.assertEqual(result, Seq((Call("echo hello"), Call("echo world"))))
+
+    def test_parse_with_call_pipe(self):
+        result = self.parse_tree("echo hello | echo world")
+        self.assertEqual(result, Pipe((Call("echo hello"), Call("echo world"))))
 
     def test_nested_quoting_parsing(self):
-        command_structure = [{'double_quoted': [{'backquoted': [{'inner': [Token('__ANON_1', 'echo ')]}, {'single_quoted': [{'inner': [Token('__ANON_1', 'hello')]}]}]}]}]
-        parsed = self.parser.parse_quoted(command_structure)
-        self.assertEqual(parsed, "`echo 'hello'`")
+        result = self.parse_tree("x \"`echo 'hello'`\"")
+        self.assertEqual(result, Call("x `echo 'hello'`", (), Substitution("x ", Call("echo hello"), "")))
 
     def test_nested_back_quoting_parsing(self):
-        command_structure = [{'backquoted': [{'inner': [Token('__ANON_1', 'echo ')]}, {'double_quoted': [{'backquoted': [{'inner': [Token('__ANON_1', 'echo abc')]}]}]}]}]
         with self.assertRaises(ValueError):
-            self.parser.parse_quoted(command_structure)
+            self.parse_tree("`echo \"`echo abc`\"`")
 
     def test_disqualified_back_quoting(self):
-        command_structure = [{'single_quoted': [{'backquoted': [{'inner': [Token('__ANON_1', 'echo abc')]}]}]}]
-        parsed = self.parser.parse_quoted(command_structure)
-        self.assertEqual(parsed, "`echo abc`")
+        result = self.parse_tree("x '`echo abc`'")
+        self.assertEqual(result, Call("x `echo abc`"))
+        self.assertIsNone(result.substitution)
 
     def test_parse_exception(self):
         with self.assertRaises(ValueError):
@@ -124,5 +98,146 @@ class TestCommandParser(unittest.TestCase):
             self.parser.parse()
 
 
+class TestParseCache(unittest.TestCase):
+    def setUp(self):
+        PARSE_CACHE.clear()
+
+    def tearDown(self):
+        PARSE_CACHE.clear()
+
+    def test_lru_eviction(self):
+        cache = ParseCache(maxsize=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("c"), 3)
+        self.assertEqual(cache.info(), {"hits": 3, "misses": 1, "size": 2, "maxsize": 2})
+
+    def test_repeated_line_hits_cache(self):
+        for _ in range(3):
+            CommandParser("echo hello", deque()).parse()
+        self.assertEqual(PARSE_CACHE.hits, 2)
+        self.assertEqual(PARSE_CACHE.misses, 1)
+
+    def test_cache_hit_skips_lark(self):
+        CommandParser("echo hello", deque()).parse()
+        with patch('shellParsing.larkParser') as mock_lark:
+            out = deque()
+            CommandParser("echo hello", out).parse()
+            mock_lark.assert_not_called()
+        self.assertEqual(list(out), ["hello\n"])
+
+    def test_pipeline_does_not_mutate_cached_entry(self):
+        for _ in range(2):
+            out = deque()
+            CommandParser("echo hello | cat", out).parse()
+            self.assertEqual(list(out), ["hello\n"])
+        cached, _ = PARSE_CACHE.get("echo hello | cat")
+        self.assertEqual(cached.node, Pipe((Call("echo hello"), Call("cat"))))
+
+    def test_errors_raised_on_cache_hits(self):
+        cmdlines = {
+            "echo `echo \"`echo a`\"`": "Invalid command substitution syntax",
+            "echo a > o.txt | cat": "Output redirection in the middle of a pipeline",
+        }
+        for cmdline, message in cmdlines.items():
+            for _ in range(2):
+                with self.assertRaises(ValueError) as context:
+                    CommandParser(cmdline, deque()).parse()
+                self.assertIn(message, str(context.exception))
+        self.assertEqual(PARSE_CACHE.hits, 2)
+
+
+class TestSimpleParser(unittest.TestCase):
+    def setUp(self):
+        PARSE_CACHE.clear()
+
+    def tearDown(self):
+        PARSE_CACHE.clear()
+
+    def test_simple_lines(self):
+        self.assertEqual(simpleParser("grep  foo\tlog.txt "), Call("grep foo log.txt"))
+        self.assertEqual(simpleParser("sort -r data | uniq; echo a"),
+                         Seq((Pipe((Call("sort -r data"), Call("uniq"))), Call("echo a"))))
+
+    def test_special_characters_fall_back(self):
+        for cmdline in ("echo 'a'", 'echo "a"', "echo `a`", "cat < a", "echo a > b", "echo a\nb", "echo a &"):
+            with self.subTest(cmdline=cmdline):
+                self.assertIsNone(simpleParser(cmdline))
+
+    def test_simple_line_skips_lark(self):
+        with patch('shellParsing.larkParser') as mock_lark:
+            out = deque()
+            CommandParser("echo hello | cat", out).parse()
+            mock_lark.assert_not_called()
+        self.assertEqual(list(out), ["hello\n"])
+
+    def test_fast_path_agrees_with_lark(self):
+        pieces = ["echo", "grep", "a", "-n", "*.txt", " ", "  ", "\t", "\r", ";", "|", "'", "\"", "`", "<", ">"]
+        rng = random.Random(0)
+        checked = 0
+        for _ in range(2000):
+            cmdline = "".join(rng.choice(pieces) for _ in range(rng.randint(0, 8)))
+            tree = simpleParser(cmdline)
+            if tree is None:
+                continue
+            checked += 1
+            for mode in ("lalr", "earley"):
+                with self.subTest(cmdline=cmdline, mode=mode):
+                    self.assertEqual(tree, larkParser(LARK_GRAMMAR, cmdline, mode))
+        self.assertGreater(checked, 100)
+
+
+class TestLongLines(unittest.TestCase):
+    def setUp(self):
+        PARSE_CACHE.clear()
+
+    def tearDown(self):
+        PARSE_CACHE.clear()
+
+    def test_long_sequence(self):
+        out = deque()
+        CommandParser("; ".join(f"echo {i}" for i in range(10000)), out).parse()
+        self.assertEqual(len(out), 10000)
+        self.assertEqual((out[0], out[-1]), ("0\n", "9999\n"))
+
+    def test_long_pipeline(self):
+        out = deque()
+        CommandParser(" | ".join(["echo a"] + ["cat"] * 9999), out).parse()
+        self.assertEqual(list(out), ["a\n"])
+
+    def test_long_sequence_is_flat(self):
+        tree = CommandParser(";".join(["echo a | cat"] * 10000), deque()).parse_tree()
+        self.assertEqual(len(tree.commands), 10000)
+        self.assertEqual(tree.commands[-1], Pipe((Call("echo a"), Call("cat"))))
+
+    def test_long_sequence_error_is_not_nested(self):
+        with self.assertRaises(ValueError) as context:
+            CommandParser("; ".join(["echo a"] * 10000 + ["nosuchapp"]), deque()).parse()
+        self.assertEqual(str(context.exception).count("Error executing sequence command"), 1)
+
+
+class TestScriptParser(unittest.TestCase):
+
+    def test_parse_script(self):
+        lines = ["#!/comp0010/sh -f\n", "echo a\r\n", "   \n", "echo `\n", "echo b | cat\n", "echo a > o.txt | cat\n"]
+        plans, errors = ScriptParser(lines).parse()
+        self.assertEqual([(lineno, cmdline) for lineno, cmdline, _ in plans], [(2, "echo a"), (5, "echo b | cat")])
+        self.assertEqual(plans[1][2].node, Pipe((Call("echo b"), Call("cat"))))
+        self.assertEqual([lineno for lineno, _ in errors], [4, 6])
+        self.assertIn("Output redirection in the middle of a pipeline", errors[1][1])
+
+    def test_run_compiled_plan(self):
+        plans, _ = ScriptParser(["echo hello\n"]).parse()
+        out = deque()
+        with patch('shellParsing.larkParser') as mock_lark:
+            CommandParser("echo hello", out).parse(plans[0][2])
+            mock_lark.assert_not_called()
+        self.assertEqual(list(out), ["hello\n"])
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,352 @@
+import os
+import threading
+import unittest
+from unittest.mock import patch
+import sys
+sys.path.append('./src')
+from collections import deque
+from itertools import chain
+from concurrent.futures import ThreadPoolExecutor
+from shellAst import Call, Pipe, Seq, Redirect, Substitution
+from shellPlan import compilePlan, CallPlan, PipePlan, SeqPlan
+from shellCommands import EchoCommand
+from shellDecorator import commandRegistry
+from shellFileProcessing import FileProcessingCommand, Chunks
+from shellWorkerPool import WorkerPool
+from shellMemo import MEMO_CACHE
+from shellLarkParser import larkParser, LARK_GRAMMAR
+
+
+def compile_line(cmdline):
+    return compilePlan(larkParser(LARK_GRAMMAR, cmdline))
+
+
+class TestPlan(unittest.TestCase):
+
+    def test_compile_dispatch(self):
+        plan = compile_line("echo a; echo b | cat")
+        self.assertIsInstance(plan, SeqPlan)
+        self.assertIsInstance(plan.commands[0], CallPlan)
+        self.assertIsInstance(plan.commands[1], PipePlan)
+
+    def test_invalid_node(self):
+        with self.assertRaises(ValueError) as context:
+            compilePlan("echo a")
+        self.assertIn("Invalid command line", str(context.exception))
+
+    def test_call_resolved_ahead(self):
+        plan = compilePlan(Call("echo hello world", (Redirect("output", "o.txt", True),)))
+        self.assertEqual(plan.resolved, ("echo", EchoCommand, ("hello world",)))
+        self.assertEqual(plan.redirection, (None, ("o.txt", True)))
+
+    def test_run_skips_registry_lookup(self):
+        plan = compile_line("echo hello | cat")
+        out = deque()
+        with patch.dict(commandRegistry, {}, clear=True):
+            plan.run(out)
+        self.assertEqual(list(out), ["hello\n"])
+
+    def test_plan_is_immutable(self):
+        plan = compile_line("echo hello")
+        with self.assertRaises(AttributeError):
+            plan.resolved = None
+        with self.assertRaises(AttributeError):
+            del plan.node
+
+    def test_run_repeatedly(self):
+        plan = compile_line("echo a; echo `echo b` c")
+        for _ in range(3):
+            out = deque()
+            plan.run(out)
+            self.assertEqual(list(out), ["a\n", "b c\n"])
+
+    def test_run_concurrently(self):
+        plan = compile_line("echo a b c | cut -b 1,3; echo d")
+
+        def run(_):
+            out = deque()
+            plan.run(out)
+            return list(out)
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(run, range(64)))
+        self.assertTrue(all(result == ["ab\n", "d\n"] for result in results))
+
+    def test_errors_raised_when_run(self):
+        plan = compile_line("echo a; echo b < x.txt < y.txt")
+        out = deque()
+        with self.assertRaises(ValueError) as context:
+            plan.run(out)
+        self.assertEqual(str(context.exception),
+                         "Error executing sequence command: Error executing call command: Multiple input redirections")
+        self.assertEqual(list(out), ["a\n"])
+
+    def test_redirections(self):
+        redirects = (Redirect('input', 'input.txt', False), Redirect('output', 'output.txt', True))
+        self.assertEqual(CallPlan.handle_io_redirection(redirects), (('input.txt', False), ('output.txt', True)))
+
+    def test_multiple_redirections(self):
+        for direction in ('input', 'output'):
+            redirects = (Redirect(direction, 'a.txt', False), Redirect(direction, 'b.txt', False))
+            with self.assertRaises(ValueError) as context:
+                CallPlan.handle_io_redirection(redirects)
+            self.assertEqual(str(context.exception), f"Multiple {direction} redirections")
+
+    def test_sequence_substitution(self):
+        node = Call("echo `echo a; echo b` c", (), Substitution("echo ", Seq((Call("echo a"), Call("echo b"))), " c"))
+        out = deque()
+        compilePlan(node).run(out)
+        self.assertEqual(list(out), ["a b c\n"])
+
+    def test_unknown_application(self):
+        with self.assertRaises(ValueError) as context:
+            compile_line("nosuchapp a").run(deque())
+        self.assertIn("Unknown application: nosuchapp", str(context.exception))
+
+    def test_output_redirection(self):
+        plan = compile_line("echo hello > plan_output.txt")
+        try:
+            out = deque()
+            plan.run(out)
+            self.assertEqual(list(out), [])
+            with open("plan_output.txt") as f:
+                self.assertEqual(f.read(), "hello\n")
+        finally:
+            os.remove("plan_output.txt")
+
+    def test_matches_ast(self):
+        node = Pipe((Call("echo a"), Seq((Call("cat"), Call("echo b")))))
+        self.assertIs(compilePlan(node).node, node)
+
+
+class TestStreamingPipe(unittest.TestCase):
+    def setUp(self):
+        # Every pipeline has to run for its stages to be seen
+        memo = patch.object(MEMO_CACHE, "enabled", False)
+        memo.start()
+        self.addCleanup(memo.stop)
+        self.events = []
+        events = self.events
+
+        # Produces three lines, recording when each one is made
+        class Source(FileProcessingCommand):
+            def stream(self):
+                for i in range(3):
+                    events.append(f"source {i}")
+                    yield f"{i}\n"
+
+        # Records each line as it arrives
+        class Sink(FileProcessingCommand):
+            def stream(self):
+                for line in chain.from_iterable(self.chunk_stdin()):
+                    events.append(f"sink {line.strip()}")
+                    yield line
+
+        self.registry = {"source": Source, "sink": Sink}
+
+    def test_head_cancels_upstream(self):
+        events = self.events
+
+        # Never ends unless it is cancelled
+        class Yes(FileProcessingCommand):
+            def stream(self):
+                try:
+                    while True:
+                        yield "y\n"
+                finally:
+                    events.append("closed")
+
+        out = deque()
+        with patch.dict(commandRegistry, {"yes": Yes}):
+            compile_line("yes | cat | head -n 3").run(out)
+        self.assertEqual(list(out), ["y\n"] * 3)
+        self.assertEqual(self.events, ["closed"])
+
+    def test_cancelled_stage_closes_its_file(self):
+        opened = []
+        open_file = FileProcessingCommand.open_file
+
+        def record(command, filename):
+            opened.append(open_file(command, filename))
+            return opened[-1]
+
+        with patch.object(FileProcessingCommand, 'open_file', record):
+            out = deque()
+            compile_line("cat test/test_plan.py | head -n 1").run(out)
+        self.assertEqual(len(out), 1)
+        self.assertTrue(opened[0].closed)
+
+    def test_stages_interleave(self):
+        out = deque()
+        # Lines travel in chunks, one line long here, and no stage waits for the whole input
+        with patch.dict(commandRegistry, self.registry), patch('shellFileProcessing.CHUNK_SIZE', 1):
+            compile_line("source | sink | sink").run(out)
+        self.assertEqual(list(out), ["0\n", "1\n", "2\n"])
+        self.assertLess(self.events.index("sink 0"), self.events.index("source 1"))
+
+    def test_chunks_passed_on(self):
+        received = []
+
+        class Chunked(FileProcessingCommand):
+            def chunks(self):
+                received.append(self.contents)
+                yield from self.chunk_stdin()
+
+        out = deque()
+        with patch.dict(commandRegistry, {"chunked": Chunked}):
+            compile_line("cat test/test_plan.py | chunked | grep def").run(out)
+        self.assertIsInstance(received[0], Chunks)
+        expected = deque()
+        compile_line("grep def test/test_plan.py").run(expected)
+        self.assertEqual(list(out), list(expected))
+
+    def test_first_failing_stage_is_reported(self):
+        cmdlines = {
+            "cat nosuchfile.txt | grep a": "Failed 'cat' initialize",
+            "echo a | nosuchapp | cat": "Unknown application: nosuchapp",
+            "cat nosuchfile.txt | cat | cat": "Failed 'cat' initialize",
+            # The last stage fails before reading, so the first stage never runs
+            "cat nosuchfile.txt | nosuchapp": "Unknown application: nosuchapp",
+            "echo a | cat | grep": "Invalid grep arguments",
+        }
+        for cmdline, message in cmdlines.items():
+            with self.subTest(cmdline=cmdline):
+                out = deque()
+                with self.assertRaises(ValueError) as context:
+                    compile_line(cmdline).run(out)
+                self.assertTrue(str(context.exception).startswith("Error executing pipeline command: "))
+                self.assertIn(message, str(context.exception))
+                self.assertEqual(list(out), [])
+
+    def test_unsafe_stage_output(self):
+        out = deque()
+        compile_line("echo a | _cat nosuchfile.txt | cut -b 1-5").run(out)
+        self.assertEqual(list(out), ["Error\n"])
+
+    def test_empty_stage_output_is_piped(self):
+        out = deque()
+        compile_line("echo a | grep b | cat").run(out)
+        self.assertEqual(list(out), [])
+
+    def test_long_pipeline_is_chunked(self):
+        out = deque()
+        compile_line(" | ".join(["echo a"] + ["cat"] * 300)).run(out)
+        self.assertEqual(list(out), ["a\n"])
+
+
+# The same pipelines with every stage but the last on its own thread
+class TestThreadedPipe(TestStreamingPipe):
+    def setUp(self):
+        super().setUp()
+        mode = patch('shellPlan.PIPELINE_MODE', "threads")
+        mode.start()
+        self.addCleanup(mode.stop)
+
+    def test_stages_interleave(self):
+        out = deque()
+        with patch.dict(commandRegistry, self.registry):
+            compile_line("source | sink | sink").run(out)
+        self.assertEqual(list(out), ["0\n", "1\n", "2\n"])
+
+    # grep never puts a batch, so only the pipeline's cancellation stops it reading
+    def test_done_pipeline_stops_filter_without_output(self):
+        events = self.events
+
+        class Yes(FileProcessingCommand):
+            def stream(self):
+                try:
+                    while True:
+                        yield "y\n"
+                finally:
+                    events.append("closed")
+
+        out = deque()
+        with patch.dict(commandRegistry, {"yes": Yes}):
+            compile_line("yes | grep x | echo done").run(out)
+        self.assertEqual(list(out), ["done\n"])
+        self.assertEqual(self.events, ["closed"])
+
+    # cat waits on the terminal for more input and never sees the cancellation
+    def test_stage_blocked_on_input_is_left(self):
+        released = threading.Event()
+        self.addCleanup(released.set)
+
+        def terminal():
+            yield "a\n"
+            released.wait(10)
+
+        out = deque()
+        with patch('sys.stdin', terminal()), patch('shellPlan.STAGE_CLOSE_TIMEOUT', 0.1), \
+                patch('shellPlan.BATCH_SIZE', 1), patch('shellFileProcessing.CHUNK_SIZE', 1):
+            compile_line("cat | head -n 1").run(out)
+        self.assertEqual(list(out), ["a\n"])
+        self.assertFalse(released.is_set())
+
+    def test_batches_keep_order(self):
+        out = deque()
+        with patch('shellPlan.BATCH_SIZE', 7), patch('shellPlan.QUEUE_BATCHES', 2):
+            compile_line("cat test/test_plan.py | cat | grep def").run(out)
+        expected = deque()
+        compile_line("grep def test/test_plan.py").run(expected)
+        self.assertEqual(list(out), list(expected))
+
+    def test_uses_threads(self):
+        threads = []
+
+        class Where(FileProcessingCommand):
+            def stream(self):
+                threads.append(threading.current_thread())
+                yield from chain.from_iterable(self.chunk_stdin())
+
+        out = deque()
+        with patch.dict(commandRegistry, {"where": Where}):
+            compile_line("echo a | where | where | where").run(out)
+        self.assertEqual(list(out), ["a\n"])
+        self.assertEqual(len(set(threads)), 3)
+        self.assertIs(threads[-1], threading.main_thread())
+
+
+# CPU-bound stages on worker processes, with chunks small enough to use them
+class TestProcessPipe(unittest.TestCase):
+    def setUp(self):
+        self.pool = WorkerPool(workers=2, chunk_lines=5)
+        for name, value in (("PIPELINE_MODE", "processes"), ("WORKER_POOL", self.pool)):
+            patcher = patch(f'shellPlan.{name}', value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        memo = patch.object(MEMO_CACHE, "enabled", False)
+        memo.start()
+        self.addCleanup(memo.stop)
+        self.addCleanup(self.pool.shutdown)
+
+    def test_matches_streaming(self):
+        cmdlines = [
+            "cat test/test_plan.py | grep def | sort",
+            "cat test/test_plan.py | cut -b 1-6,10 | sort -r | uniq",
+            "cat test/test_plan.py | grep self | cut -b 3- | head -n 7",
+        ]
+        for cmdline in cmdlines:
+            with self.subTest(cmdline=cmdline):
+                out = deque()
+                compile_line(cmdline).run(out)
+                with patch('shellPlan.PIPELINE_MODE', "stream"):
+                    expected = deque()
+                    compile_line(cmdline).run(expected)
+                self.assertEqual(list(out), list(expected))
+                self.assertGreater(len(out), 5)
+
+    def test_pool_shared_across_lines(self):
+        compile_line("cat test/test_plan.py | grep def").run(deque())
+        executor = self.pool.pool
+        self.assertIsNotNone(executor)
+        compile_line("cat test/test_plan.py | sort").run(deque())
+        self.assertIs(self.pool.pool, executor)
+
+    def test_invalid_pattern(self):
+        with self.assertRaises(ValueError) as context:
+            compile_line("cat test/test_plan.py | grep a(").run(deque())
+        self.assertIn("Error executing grep application", str(context.exception))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+import os
+import json
+import tempfile
+import unittest
+from unittest.mock import Mock, patch
+import sys
+sys.path.append('./src')
+from collections import deque
+import shellProfile
+from shellProfile import Profiler, StageRecord
+from shellParsing import CommandParser
+from shellDecorator import commandRegistry
+from shellFileProcessing import FileProcessingCommand
+
+
+class TestProfile(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.path = os.path.join(self.temp_dir.name, "profile.jsonl")
+        with open(os.path.join(self.temp_dir.name, "lines.txt"), "w") as f:
+            f.write("b\na\nc\na\n")
+        cwd = os.getcwd()
+        os.chdir(self.temp_dir.name)
+        self.addCleanup(os.chdir, cwd)
+        shellProfile.enable(self.path)
+        self.addCleanup(shellProfile.disable)
+
+    def run_line(self, cmdline):
+        out = deque()
+        CommandParser(cmdline, out).parse()
+        return list(out)
+
+    def results(self):
+        with open(self.path) as f:
+            return [json.loads(line) for line in f]
+
+    def test_pipeline_stages(self):
+        self.assertEqual(self.run_line("cat lines.txt | grep a | sort"), ["a\n", "a\n"])
+        total, cat, grep, sort = self.results()
+        self.assertEqual((total["kind"], total["command"]), ("pipeline", "cat lines.txt | grep a | sort"))
+        self.assertEqual([cat["stage"], grep["stage"], sort["stage"]], [1, 2, 3])
+        self.assertEqual((cat["lines_in"], cat["lines_out"], cat["bytes_out"]), (0, 4, 8))
+        self.assertEqual((grep["lines_in"], grep["bytes_in"], grep["lines_out"]), (4, 8, 2))
+        self.assertEqual((sort["lines_in"], sort["lines_out"]), (2, 2))
+        self.assertEqual(total["lines_out"], 2)
+        for result in (cat, grep, sort):
+            self.assertGreaterEqual(result["wall_ms"], 0)
+            self.assertIsNone(result["error"])
+        # Stage times are their own, so together they stay within the pipeline's
+        self.assertLessEqual(sum(r["wall_ms"] for r in (cat, grep, sort)), total["wall_ms"] + 0.01)
+
+    def test_threaded_pipeline(self):
+        with patch("shellPlan.PIPELINE_MODE", "threads"):
+            self.assertEqual(self.run_line("cat lines.txt | uniq"), ["b\n", "a\n", "c\n", "a\n"])
+        total, cat, uniq = self.results()
+        self.assertEqual((cat["lines_out"], uniq["lines_in"], uniq["lines_out"]), (4, 4, 4))
+
+    # Memory used on a stage's thread counts for the pipeline as well
+    def test_threaded_pipeline_peak(self):
+        class Alloc(FileProcessingCommand):
+            def chunks(self):
+                block = bytearray(1 << 20)
+                yield from self.chunk_stdin()
+                del block
+
+        with patch("shellPlan.PIPELINE_MODE", "threads"), patch.dict(commandRegistry, {"alloc": Alloc}):
+            self.run_line("cat lines.txt | alloc | cat")
+        total, *stages = self.results()
+        self.assertGreaterEqual(stages[1]["peak_kib"], 1024)
+        for stage in stages:
+            self.assertGreaterEqual(total["peak_kib"], stage["peak_kib"])
+
+    def test_calls_reported(self):
+        self.run_line("echo hello; cat lines.txt > out.txt")
+        echo, cat = self.results()
+        self.assertEqual((echo["kind"], echo["stage"], echo["command"]), ("call", None, "echo hello"))
+        self.assertEqual((echo["lines_out"], echo["bytes_out"]), (1, 6))
+        # Redirected output does not reach the command line's output
+        self.assertEqual((cat["command"], cat["lines_out"]), ("cat lines.txt > out.txt", 0))
+
+    def test_failed_stage(self):
+        with self.assertRaises(ValueError):
+            self.run_line("echo a | cat nofile | sort")
+        total, echo, cat, sort = self.results()
+        self.assertIsNotNone(cat["error"])
+        self.assertIsNone(echo["error"])
+
+    def test_stderr_report(self):
+        shellProfile.enable()
+        with patch("sys.stderr") as stderr:
+            self.run_line("echo a | cat")
+        text = "".join(call.args[0] for call in stderr.write.call_args_list)
+        self.assertIn("profile: echo a | cat: wall", text)
+        self.assertIn("profile:   [2] cat: wall", text)
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_cache_report(self):
+        shellProfile.PROFILER.report_cache("parse", {"hits": 2, "misses": 1, "size": 1, "maxsize": 256})
+        self.assertEqual(self.results(), [{"kind": "cache", "command": "parse", "hits": 2, "misses": 1,
+                                           "size": 1, "maxsize": 256}])
+        self.assertEqual(Profiler.format(self.results()[0]), "profile: parse cache: hits 2, misses 1, entries 1/256")
+
+    def test_disabled(self):
+        shellProfile.disable()
+        self.assertIsNone(shellProfile.PROFILER)
+        self.assertEqual(self.run_line("echo a | cat"), ["a\n"])
+        self.assertFalse(os.path.exists(self.path))
+        shellProfile.enable(self.path)
+
+    def test_peak_memory(self):
+        profiler = Profiler(self.path)
+        record = StageRecord("call", "alloc")
+        profiler.measure(record, lambda: bytearray(1 << 20))
+        self.assertGreaterEqual(record.result()["peak_kib"], 1024)
+
+    # tracemalloc as in Python 3.8, where the peak cannot be reset
+    def test_peak_without_reset(self):
+        memory = {"current": 100, "peak": 5000}
+        traced = Mock(spec=["get_traced_memory"])
+        traced.get_traced_memory.side_effect = lambda: (memory["current"], memory["peak"])
+        with patch("shellProfile.tracemalloc", traced):
+            profiler = Profiler(self.path)
+            earlier = StageRecord("call", "earlier")
+            profiler.enter(earlier)
+            memory["current"] = 300
+            profiler.leave(earlier)
+            growing = StageRecord("call", "growing")
+            profiler.enter(growing)
+            memory.update(current=200, peak=9000)
+            profiler.leave(growing)
+        # The peak reached before a record ran is not its own
+        self.assertEqual((earlier.peak - earlier.base, growing.peak - growing.base), (200, 8700))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,11 @@
 import unittest
-from unittest.mock import patch
+from unittest.mock import patch, mock_open
 import sys
+import io
 sys.path.append('./src')
 from shell import Comp0010Shell
+from shellParsing import PARSE_CACHE
+import shellProfile
 
 
 class TestComp0010Shell(unittest.TestCase):
@@ -20,6 +23,14 @@ class TestComp0010Shell(unittest.TestCase):
             self.shell.run_command_line("echo test")
             mock_print.assert_called_with("test\n", end="")
 
+    def test_write_flushes_only_for_lines_or_terminal(self):
+        for policy, tty, flushed in [("size", False, False), ("size", True, True), ("line", False, True)]:
+            self.shell.out.flush_policy = policy
+            with patch('shell.print'), patch('sys.stdout') as stdout:
+                stdout.isatty.return_value = tty
+                self.shell.write("test\n")
+            self.assertEqual(stdout.flush.called, flushed)
+
     def test_run_shell_with_args(self):
         test_args = ["shell.py", "-c", "echo test"]
         with patch.object(sys, 'argv', test_args):
@@ -27,6 +38,49 @@ class TestComp0010Shell(unittest.TestCase):
                 self.shell.run_shell()
                 mock_run_command_line.assert_called_with("echo test")
 
+    def test_run_shell_waits_for_jobs(self):
+        test_args = ["shell.py", "-c", "echo a & echo b"]
+        with patch.object(sys, 'argv', test_args), patch('shell.print') as mock_print:
+            self.shell.run_shell()
+        self.assertEqual([c.args[0] for c in mock_print.call_args_list], ["b\n", "a\n"])
+
+    def test_run_shell_stops_pools(self):
+        for test_args in (["shell.py", "-c", "echo test"], ["shell.py", "-c"]):
+            with patch.object(sys, 'argv', test_args), patch('shell.WORKER_POOL') as mock_pool:
+                with patch('shell.JOBS') as mock_jobs, patch('shell.print'):
+                    try:
+                        self.shell.run_shell()
+                    except ValueError:
+                        pass
+            mock_pool.shutdown.assert_called_once()
+            mock_jobs.shutdown.assert_called_once()
+
+    def test_run_shell_error_not_hidden_by_job(self):
+        test_args = ["shell.py", "-c", "nosuchjob & nosuchapp"]
+        with patch.object(sys, 'argv', test_args), patch('sys.stderr') as stderr:
+            with self.assertRaises(ValueError) as context:
+                self.shell.run_shell()
+        self.assertIn("Unknown application: nosuchapp", str(context.exception))
+        reported = "".join(call.args[0] for call in stderr.write.call_args_list)
+        self.assertIn("Unknown application: nosuchjob", reported)
+
+    def test_run_shell_with_profile(self):
+        test_args = ["shell.py", "--profile=profile.jsonl", "-c", "echo test"]
+        with patch.object(sys, 'argv', test_args), patch('shell.shellProfile.enable') as mock_enable:
+            with patch('shell.Comp0010Shell.run_command_line') as mock_run_command_line:
+                self.shell.run_shell()
+        mock_enable.assert_called_with("profile.jsonl")
+        mock_run_command_line.assert_called_with("echo test")
+
+    def test_run_shell_profile_reports_parse_cache(self):
+        test_args = ["shell.py", "--profile", "-c", "echo a; echo a"]
+        PARSE_CACHE.clear()
+        self.addCleanup(shellProfile.disable)
+        with patch.object(sys, 'argv', test_args), patch('shell.print'), patch('sys.stderr') as stderr:
+            self.shell.run_shell()
+        report = "".join(call.args[0] for call in stderr.write.call_args_list)
+        self.assertIn("profile: parse cache: hits 0, misses 1, entries 1/256", report)
+
     def test_run_shell_with_incorrect_args(self):
         test_args = ["shell.py", "-c"]
         with patch.object(sys, 'argv', test_args):
@@ -41,6 +95,62 @@ class TestComp0010Shell(unittest.TestCase):
                 self.shell.run_shell()
             self.assertEqual(str(context.exception), "Unexpected program argument -x")
 
+    def test_run_script(self):
+        lines = ["echo a\n", "\n", "# comment\n", "echo b | cat\n"]
+        with patch('shell.print') as mock_print:
+            status = self.shell.run_script(lines)
+        self.assertEqual(status, 0)
+        self.assertEqual([c.args[0] for c in mock_print.call_args_list], ["a\n", "b\n"])
+
+    def test_run_script_reports_all_syntax_errors_first(self):
+        lines = ["echo a\n", "echo `\n", "echo b\n", "echo \"c\n"]
+        with patch('shell.print') as mock_print:
+            status = self.shell.run_script(lines)
+        self.assertEqual(status, 2)
+        messages = [c.args[0] for c in mock_print.call_args_list]
+        self.assertEqual(len(messages), 2)
+        self.assertTrue(messages[0].startswith("Syntax error on line 2"))
+        self.assertTrue(messages[1].startswith("Syntax error on line 4"))
+
+    def test_run_script_stops_on_first_error(self):
+        lines = ["echo a\n", "nosuchapp\n", "echo b\n"]
+        with patch('shell.print') as mock_print:
+            status = self.shell.run_script(lines)
+        self.assertEqual(status, 1)
+        messages = [c.args[0] for c in mock_print.call_args_list]
+        self.assertEqual(messages[0], "a\n")
+        self.assertTrue(messages[1].startswith("Error on line 2"))
+        self.assertEqual(len(messages), 2)
+
+    def test_run_script_continue_on_error(self):
+        lines = ["nosuchapp\n", "echo b\n"]
+        with patch('shell.print') as mock_print:
+            status = self.shell.run_script(lines, keep_going=True)
+        self.assertEqual(status, 1)
+        self.assertEqual(mock_print.call_args_list[-1].args[0], "b\n")
+
+    def test_run_shell_with_script_file(self):
+        test_args = ["shell.py", "-f", "script.sh", "--continue-on-error"]
+        with patch.object(sys, 'argv', test_args):
+            with patch('builtins.open', mock_open(read_data="echo a\necho b\n")):
+                with patch('shell.Comp0010Shell.run_script', return_value=0) as mock_run_script:
+                    self.assertEqual(self.shell.run_shell(), 0)
+                    mock_run_script.assert_called_with(["echo a\n", "echo b\n"], True)
+
+    def test_run_shell_with_script_from_stdin(self):
+        test_args = ["shell.py", "-f", "-"]
+        with patch.object(sys, 'argv', test_args), patch.object(sys, 'stdin', io.StringIO("echo a\n")):
+            with patch('shell.Comp0010Shell.run_script', return_value=0) as mock_run_script:
+                self.shell.run_shell()
+                mock_run_script.assert_called_with(["echo a\n"], False)
+
+    def test_run_shell_with_unexpected_script_mode(self):
+        test_args = ["shell.py", "-f", "script.sh", "--retry"]
+        with patch.object(sys, 'argv', test_args):
+            with self.assertRaises(ValueError) as context:
+                self.shell.run_shell()
+            self.assertEqual(str(context.exception), "Unexpected program argument --retry")
+
 
 if __name__ == '__main__':
     unittest.main()
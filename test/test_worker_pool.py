@@ -0,0 +1,69 @@
+import time
+import unittest
+from unittest.mock import Mock, patch
+from concurrent.futures import ThreadPoolExecutor
+import sys
+sys.path.append('./src')
+from shellWorkerPool import WorkerPool
+from shellCommands import grep_chunk, cut_chunk, sort_chunk
+
+
+def double(factor, lines):
+    return [line * factor for line in lines]
+
+
+class TestWorkerPool(unittest.TestCase):
+    def setUp(self):
+        self.pool = WorkerPool(workers=2, chunk_lines=3)
+
+    def tearDown(self):
+        self.pool.shutdown()
+
+    def test_chunks(self):
+        self.assertEqual(list(self.pool.chunks(range(7))), [[0, 1, 2], [3, 4, 5], [6]])
+
+    def test_small_input_stays_in_process(self):
+        self.assertEqual(list(self.pool.map(double, (2,), ["a", "b"])), [["aa", "bb"]])
+        self.assertIsNone(self.pool.pool)
+
+    def test_map_keeps_order(self):
+        results = self.pool.map(double, (2,), [str(i) for i in range(20)])
+        self.assertEqual(sum(results, []), [str(i) * 2 for i in range(20)])
+        self.assertIsNotNone(self.pool.pool)
+
+    def test_pool_reused(self):
+        list(self.pool.map(double, (1,), range(10)))
+        executor = self.pool.pool
+        list(self.pool.map(double, (1,), range(10)))
+        self.assertIs(self.pool.pool, executor)
+
+    def test_shutdown_cancels_pending_work(self):
+        results = self.pool.map(double, (1,), [str(i) for i in range(30)])
+        next(results)
+        waiting = list(self.pool.pending)
+        self.pool.shutdown()
+        self.assertIsNone(self.pool.pool)
+        self.assertTrue(all(future.done() for future in waiting))
+        self.assertFalse(self.pool.pending)
+
+    def test_pool_started_once_across_threads(self):
+        def slow_pool(max_workers):
+            time.sleep(0.05)
+            return Mock()
+
+        with patch('shellWorkerPool.ProcessPoolExecutor', side_effect=slow_pool) as executor:
+            with ThreadPoolExecutor(max_workers=4) as threads:
+                pools = list(threads.map(lambda _: self.pool.executor(), range(4)))
+        self.assertEqual(executor.call_count, 1)
+        self.assertTrue(all(pool is pools[0] for pool in pools))
+
+    def test_command_chunks(self):
+        lines = ["abc\n", "bcd\n", "cde\n"]
+        self.assertEqual(grep_chunk("b", None, lines), ["abc\n", "bcd\n"])
+        self.assertEqual(grep_chunk("b", "f.txt", lines[:1]), ["f.txt:abc\n"])
+        self.assertEqual(cut_chunk([(0, 1), (2, None)], lines), ["ac\n", "bd\n", "ce\n"])
+        self.assertEqual(sort_chunk(True, lines), ["cde\n", "bcd\n", "abc\n"])
+
+
+if __name__ == "__main__":
+    unittest.main()